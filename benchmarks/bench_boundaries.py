@@ -0,0 +1,307 @@
+"""Boundary accuracy and speed over a ground-truth collection (groundtruth/*.pyjama)
+
+python -m benchmarks.bench_boundaries groundtruth/rwc-pop.pyjama --audio_dir path/to/rwc-pop \
+    --method ssmnet -o bench_rwc-pop.json [--compare bench_rwc-pop_before.json]
+
+Tracks are looked up in --audio_dir (recursively) by the stem of their "filepath", so
+the audio can be in any format, or MIDI for --method ssm_utils. --method ssmnet runs
+SsmNetDeploy as the ssmnet command does, its stages are those of its Profiler. A first
+track is processed before timing (model loading, numba compilation). The JSON record
+holds the hit-rate F-measure at 0.5 s and 3 s, the wall time of each stage, the peak RSS
+and the throughput (tracks without annotated segments are listed, not evaluated);
+--compare prints the differences with an older record of the same collection, method
+and configuration, and exits with an error on a regression.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import yaml
+
+from ssmnet.profiling import Profiler, f_peak_rss_mb
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".aiff", ".m4a")
+MIDI_EXTENSIONS = (".mid", ".midi")
+WINDOWS = (0.5, 3.0)
+# --- a record is only compared with a baseline that has the same values
+COMPARABLE_KEYS = ("collection", "method", "config")
+
+
+def hit_rate(ref_v, est_v, window):
+    """
+    Boundary hit-rate (as mir_eval.segment.detection, without trimming): each reference
+    boundary matches at most one estimated boundary within +-window seconds.
+    On a line, matching greedily in time order gives a maximum matching.
+
+    Returns:
+        precision, recall, f_measure
+    """
+    ref_v = np.sort(np.unique(ref_v))
+    est_v = np.sort(np.unique(est_v))
+    if len(ref_v) == 0 or len(est_v) == 0:
+        return 0.0, 0.0, 0.0
+    nb_hit = 0
+    i = j = 0
+    while i < len(ref_v) and j < len(est_v):
+        if abs(ref_v[i] - est_v[j]) <= window:
+            nb_hit += 1
+            i += 1
+            j += 1
+        elif est_v[j] < ref_v[i]:
+            j += 1
+        else:
+            i += 1
+    precision = nb_hit / len(est_v)
+    recall = nb_hit / len(ref_v)
+    f_measure = 0.0 if nb_hit == 0 else 2 * precision * recall / (precision + recall)
+    return precision, recall, f_measure
+
+
+def find_files(folder, extensions):
+    """Files of a folder (recursive) with the given extensions, keyed by stem"""
+    file_d = {}
+    for root, _, name_l in os.walk(folder):
+        for name in sorted(name_l):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in extensions:
+                file_d.setdefault(stem, os.path.join(root, name))
+    return file_d
+
+
+def ssmnet_boundaries(ssmnet_deploy, audio_file):
+    """SSM-Net pipeline of the ssmnet command (novelty only, no SSM), timed by its profiler"""
+    feat_3m, time_sec_v = ssmnet_deploy.m_get_features(audio_file)
+    _, hat_novelty_np = ssmnet_deploy.m_get_ssm_novelty(feat_3m, get_ssm=False)
+    hat_boundary_sec_v, _ = ssmnet_deploy.m_get_boundaries(hat_novelty_np, time_sec_v)
+    return np.asarray(hat_boundary_sec_v)
+
+
+def ssm_utils_boundaries(file, args, profiler):
+    """Chroma SSM + checkerboard novelty of ssm_utils (audio or MIDI)"""
+    from midi_segmentation import ssm_utils
+
+    if file.lower().endswith(MIDI_EXTENSIONS):
+        import pretty_midi
+
+        from midi_segmentation.utils.midi import NoteTable, chroma_from_notes
+
+        with profiler.m_stage("load"):
+            midi = pretty_midi.PrettyMIDI(file)
+            notes = NoteTable.from_midi(midi)
+        with profiler.m_stage("features"):
+            chroma_m = chroma_from_notes(notes, args.feature_rate)
+            frame_rate = args.feature_rate
+    else:
+        import librosa
+
+        with profiler.m_stage("load"):
+            audio_v, sr_hz = librosa.load(file)
+        with profiler.m_stage("features"):
+            hop_length = 1024
+            chroma_m = librosa.feature.chroma_stft(
+                y=audio_v, sr=sr_hz, hop_length=hop_length
+            )
+            down_sampling = max(1, int(round(sr_hz / hop_length / args.feature_rate)))
+            chroma_m, frame_rate = ssm_utils.smooth_downsample_feature_sequence(
+                chroma_m, sr_hz / hop_length, 41, down_sampling
+            )
+
+    with profiler.m_stage("ssm"):
+        ssm = ssm_utils.BandedSSM.from_features(chroma_m, 2 * args.L)
+    with profiler.m_stage("novelty"):
+        novelty_v = ssm_utils.compute_novelty_ssm(ssm, L=args.L, exclude=True)
+    with profiler.m_stage("peaks"):
+        boundary_sec_v, _ = ssm_utils.get_boundaries(
+            novelty_v, np.arange(chroma_m.shape[1]) / frame_rate
+        )
+    return boundary_sec_v
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def relative_change(old, new):
+    """Relative change in percent, "n/a" when the old value is 0"""
+    return f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+
+
+def mismatched_keys(record, baseline):
+    """Keys of COMPARABLE_KEYS whose values differ between the record and the baseline"""
+    return [key for key in COMPARABLE_KEYS if record[key] != baseline.get(key)]
+
+
+def compare(record, baseline, tolerance):
+    """Print the differences with an older record, return True on a regression"""
+    regression = False
+    for window in record["accuracy"]:
+        old = baseline["accuracy"].get(window, {}).get("f_measure")
+        new = record["accuracy"][window]["f_measure"]
+        if old is None:
+            continue
+        print(f"F@{window}s: {old:.3f} -> {new:.3f}")
+        regression |= new < old - 0.005
+    for key in ["total_sec", "tracks_per_sec", "peak_rss_mb"]:
+        old, new = baseline[key], record[key]
+        # --- no peak RSS on Windows, see profiling.f_peak_rss_mb
+        if old is not None and new is not None:
+            print(f"{key}: {old:.2f} -> {new:.2f} ({relative_change(old, new)})")
+    for stage, new in record["stage_sec"].items():
+        old = baseline["stage_sec"].get(stage, 0.0)
+        if old > 0:
+            print(f"  {stage}: {old:.2f} -> {new:.2f} sec ({relative_change(old, new)})")
+    regression |= record["total_sec"] > baseline["total_sec"] * (1 + tolerance)
+    if record["peak_rss_mb"] is not None and baseline["peak_rss_mb"] is not None:
+        regression |= record["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance)
+    return regression
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("collection", help="ground-truth .pyjama file")
+    parser.add_argument("--audio_dir", required=True, help="folder of the tracks")
+    parser.add_argument("--method", choices=["ssmnet", "ssm_utils"], default="ssmnet")
+    parser.add_argument(
+        "-c",
+        "--config_file",
+        default=os.path.join("ssmnet", "weights_deploy", "config_example.yaml"),
+    )
+    parser.add_argument("--L", type=int, default=10, help="ssm_utils novelty kernel half size")
+    parser.add_argument(
+        "--feature_rate", type=float, default=2, help="ssm_utils chroma frames per second"
+    )
+    parser.add_argument("--limit", type=int, default=None, help="only the first N tracks")
+    parser.add_argument("-o", "--output", default="bench_boundaries.json")
+    parser.add_argument("--compare", help="older record to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="allowed relative slowdown for --compare"
+    )
+    args = parser.parse_args()
+
+    from ssmnet.groundtruth import GroundTruth
+
+    groundtruth = GroundTruth.m_load(args.collection)
+    extensions = AUDIO_EXTENSIONS + (MIDI_EXTENSIONS if args.method == "ssm_utils" else ())
+    file_d = find_files(args.audio_dir, extensions)
+
+    with open(args.config_file, "r", encoding="utf-8") as fid:
+        config_d = yaml.safe_load(fid)
+    if args.method == "ssmnet":
+        from ssmnet.core import SsmNetDeploy
+
+        ssmnet_deploy = SsmNetDeploy(config_d)
+
+    def boundaries(file, profiler):
+        if args.method == "ssmnet":
+            ssmnet_deploy.profiler = profiler
+            return ssmnet_boundaries(ssmnet_deploy, file)
+        return ssm_utils_boundaries(file, args, profiler)
+
+    track_l = groundtruth.track_l[: args.limit]
+    stem_l = [os.path.splitext(track)[0] for track in track_l]
+    found_l = [file_d[stem] for stem in stem_l if stem in file_d]
+    if not found_l:
+        sys.exit(f'no track of "{args.collection}" found in "{args.audio_dir}"')
+    # --- warm-up, not timed: model loading and numba compilation happen once per process
+    boundaries(found_l[0], Profiler(enabled=False))
+
+    profiler = Profiler()
+    result_l = []
+    missing_l = []
+    # --- no reference boundary: the F-measure is undefined, they are not averaged
+    unannotated_l = []
+    start_time = time.perf_counter()
+    for idx, track in enumerate(track_l, 1):
+        file = file_d.get(os.path.splitext(track)[0])
+        if file is None:
+            missing_l.append(track)
+            continue
+        start_v, stop_v, _ = groundtruth.m_get_segments(track)
+        if len(start_v) == 0:
+            unannotated_l.append(track)
+            continue
+        est_v = boundaries(file, profiler)
+
+        ref_v = np.concatenate((start_v, stop_v[-1:]))
+        result_d = {"track": track}
+        for window in WINDOWS:
+            result_d[f"{window:g}"] = hit_rate(ref_v, est_v, window)
+        result_l.append(result_d)
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"\r[{idx}/{len(track_l)}] {len(result_l) / elapsed:.2f} tracks/sec",
+            end="",
+            flush=True,
+        )
+    print()
+    total_sec = time.perf_counter() - start_time
+
+    if not result_l:
+        sys.exit(f'no annotated track of "{args.collection}" found in "{args.audio_dir}"')
+
+    accuracy_d = {}
+    for window in WINDOWS:
+        prf_m = np.array([result_d[f"{window:g}"] for result_d in result_l])
+        accuracy_d[f"{window:g}"] = dict(
+            zip(["precision", "recall", "f_measure"], prf_m.mean(axis=0).tolist())
+        )
+    record = {
+        "collection": os.path.basename(args.collection),
+        "method": args.method,
+        "config": (
+            config_d
+            if args.method == "ssmnet"
+            else {"L": args.L, "feature_rate": args.feature_rate}
+        ),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "nb_track": len(result_l),
+        "missing": missing_l,
+        "unannotated": unannotated_l,
+        "accuracy": accuracy_d,
+        "stage_sec": {stage: stage_d["sec"] for stage, stage_d in profiler.m_summary().items()},
+        "total_sec": total_sec,
+        "tracks_per_sec": len(result_l) / total_sec,
+        "peak_rss_mb": f_peak_rss_mb(),
+        "tracks": result_l,
+    }
+    with open(args.output, "w", encoding="utf-8") as fid:
+        json.dump(record, fid, indent=2)
+
+    peak_rss = "n/a" if record["peak_rss_mb"] is None else f"{record['peak_rss_mb']:.0f} MB"
+    print(
+        f"{len(result_l)} tracks ({len(missing_l)} missing, {len(unannotated_l)} without segments), "
+        f"{record['tracks_per_sec']:.2f} tracks/sec, peak RSS {peak_rss}"
+    )
+    for window, prf_d in accuracy_d.items():
+        print(f"F@{window}s {prf_d['f_measure']:.3f} (P {prf_d['precision']:.3f}, R {prf_d['recall']:.3f})")
+    for stage, sec in record["stage_sec"].items():
+        print(f"  {stage:>15}: {sec:8.2f} sec")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fid:
+            baseline = json.load(fid)
+        key_l = mismatched_keys(record, baseline)
+        if key_l:
+            sys.exit(f'"{args.compare}" is not comparable: different {", ".join(key_l)}')
+        if compare(record, baseline, args.tolerance):
+            sys.exit("regression")
+
+
+if __name__ == "__main__":
+    main()
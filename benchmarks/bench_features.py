@@ -0,0 +1,76 @@
+"""Piano roll / chroma: utils.midi renderers vs pretty_midi on a long file
+
+python -m benchmarks.bench_features --duration 3600 --fs 100
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pretty_midi
+
+from midi_segmentation.utils.midi import NoteTable, chroma_from_notes, piano_roll_from_notes
+
+
+def random_midi(duration: float, notes_per_sec: float, seed: int = 0) -> pretty_midi.PrettyMIDI:
+    rng = np.random.default_rng(seed)
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    count = int(duration * notes_per_sec)
+    starts = np.sort(rng.uniform(0, duration, count))
+    for start, length, pitch, velocity in zip(
+        starts,
+        rng.exponential(0.4, count),
+        rng.integers(21, 109, count),
+        rng.integers(20, 128, count),
+    ):
+        piano.notes.append(
+            pretty_midi.Note(int(velocity), int(pitch), float(start), float(start + length))
+        )
+    midi.instruments.append(piano)
+    return midi
+
+
+def timed(f, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=3600, help="seconds")
+    parser.add_argument("--notes_per_sec", type=float, default=8)
+    parser.add_argument("--fs", type=float, default=100)
+    args = parser.parse_args()
+
+    midi = random_midi(args.duration, args.notes_per_sec)
+    notes, table_sec = timed(NoteTable.from_midi, midi)
+    print(f"{len(notes)} notes, {args.duration:.0f}s at {args.fs:g} fps, NoteTable built in {table_sec:.3f}s")
+
+    reference, reference_sec = timed(midi.get_piano_roll, args.fs)
+    reference = reference[22:80]
+    num_frames = reference.shape[1]
+    for name, kwargs in (("dense", {}), ("sparse", {"sparse": True})):
+        roll, roll_sec = timed(
+            piano_roll_from_notes, notes, args.fs, (22, 80), num_frames, **kwargs
+        )
+        dense = roll.toarray() if kwargs else roll
+        nbytes = roll.data.nbytes + roll.indices.nbytes + roll.indptr.nbytes if kwargs else roll.nbytes
+        print(
+            f"piano roll 22:80 {name:>6}: {roll_sec:.3f}s vs pretty_midi {reference_sec:.3f}s "
+            f"({reference_sec / roll_sec:.0f}x), {nbytes / 1e6:.1f} MB, "
+            f"max diff {np.max(np.abs(dense - reference)):.1e}"
+        )
+
+    reference, reference_sec = timed(midi.get_chroma, args.fs)
+    chroma, chroma_sec = timed(chroma_from_notes, notes, args.fs, reference.shape[1])
+    print(
+        f"chroma: {chroma_sec:.3f}s vs pretty_midi {reference_sec:.3f}s "
+        f"({reference_sec / chroma_sec:.0f}x), {chroma.nbytes / 1e6:.1f} MB vs "
+        f"{reference.nbytes / 1e6:.1f} MB, max diff {np.max(np.abs(chroma - reference)):.1e}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Checkerboard novelty: ssm_utils.compute_novelty_ssm vs the per-frame reference
+
+python -m benchmarks.bench_novelty --sizes 1000,5000,20000 --L 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from midi_segmentation import ssm_utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,2000,5000,10000,20000")
+    parser.add_argument("--L", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=12, help="feature dimension")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>7} {'naive (s)':>10} {'band (s)':>10} {'speedup':>8} {'max diff':>9}")
+    for N in (int(n) for n in args.sizes.split(",")):
+        # --- float32 keeps the dense N x N SSM at 1.6 GB for N = 20k
+        features = rng.random((args.dim, N), dtype=np.float32)
+        S = np.dot(features.T, features)
+
+        start_time = time.perf_counter()
+        nov_naive = ssm_utils.compute_novelty_ssm_naive(S, L=args.L, exclude=True)
+        naive_sec = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        nov = ssm_utils.compute_novelty_ssm(S, L=args.L, exclude=True)
+        band_sec = time.perf_counter() - start_time
+
+        max_diff = np.max(np.abs(nov - nov_naive))
+        print(
+            f"{N:>7} {naive_sec:>10.3f} {band_sec:>10.3f} "
+            f"{naive_sec / band_sec:>7.1f}x {max_diff:>9.1e}"
+        )
+        del S
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Peak-to-mean ratio: cumulative-sum moving mean vs the per-frame loop
+
+python -m benchmarks.bench_peaks --sizes 10000,100000,1000000 --Thalf 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ssmnet.peaks import f_peak_to_mean
+
+
+def peak_to_mean_loop(data_v, param_Thalf):
+    """Previous implementation of ssm_utils.get_peaks / ssmnet.utils.f_get_peaks"""
+    nb_frame = len(data_v)
+    peak_to_mean_v = np.zeros((nb_frame))
+    for nu in range(0, nb_frame):
+        sss = max(0, nu - param_Thalf)
+        eee = min(nu + param_Thalf + 1, nb_frame)
+        local_mean = np.sum(data_v[sss:eee]) / (eee - sss)
+        peak_to_mean_v[nu] = data_v[nu] / local_mean if local_mean != 0 else 0
+    return peak_to_mean_v
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--Thalf", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>8} {'loop (s)':>10} {'cumsum (s)':>11} {'speedup':>9} {'max diff':>9}")
+    for nb_frame in (int(n) for n in args.sizes.split(",")):
+        data_v = rng.random(nb_frame)
+        # --- some silent regions to exercise the zero-mean guard
+        data_v[: nb_frame // 100] = 0
+
+        start_time = time.perf_counter()
+        loop_v = peak_to_mean_loop(data_v, args.Thalf)
+        loop_sec = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        fast_v = f_peak_to_mean(data_v, args.Thalf)
+        fast_sec = time.perf_counter() - start_time
+
+        max_diff = np.max(np.abs(fast_v - loop_v))
+        print(
+            f"{nb_frame:>8} {loop_sec:>10.3f} {fast_sec:>11.4f} "
+            f"{loop_sec / fast_sec:>8.0f}x {max_diff:>9.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Throughput of single-track vs batched SSM-Net inference on a directory of audio
+
+python -m benchmarks.bench_ssmnet_batch path/to/audio_dir [--get_ssm]
+
+Both paths compute the same outputs (novelty, and the SSM with --get_ssm), after a
+warm-up run of each, and the best of --repeat runs is reported.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import yaml
+
+from ssmnet.core import SsmNetDeploy
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".aiff", ".m4a")
+
+
+def best_sec(function, repeat):
+    """Best wall-clock time of repeat calls of function, and its last result"""
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio_dir", help="directory of audio files")
+    parser.add_argument(
+        "-c",
+        "--config_file",
+        default=os.path.join("ssmnet", "weights_deploy", "config_example.yaml"),
+    )
+    parser.add_argument("--max_batch_frame", type=int, default=4096)
+    parser.add_argument("--get_ssm", action="store_true", help="also compute the SSM")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.config_file, "r", encoding="utf-8") as fid:
+        config_d = yaml.safe_load(fid)
+
+    audio_file_l = sorted(
+        f
+        for f in glob.glob(os.path.join(args.audio_dir, "*"))
+        if f.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    ssmnet_deploy = SsmNetDeploy(config_d)
+    feat_3m_l = [ssmnet_deploy.m_get_features(f)[0] for f in audio_file_l]
+    print(
+        f"{len(feat_3m_l)} tracks, {sum(len(f) for f in feat_3m_l)} patches in total"
+    )
+
+    def run_single():
+        return [ssmnet_deploy.m_get_ssm_novelty(f, args.get_ssm)[1] for f in feat_3m_l]
+
+    def run_batch():
+        return ssmnet_deploy.m_get_ssm_novelty_batch(
+            feat_3m_l, args.get_ssm, args.max_batch_frame
+        )[1]
+
+    # --- warm-up: model loading and creation of the convolution kernels of each shape
+    run_single()
+    run_batch()
+
+    single_sec, single_l = best_sec(run_single, args.repeat)
+    batch_sec, batch_l = best_sec(run_batch, args.repeat)
+
+    max_diff = max(
+        np.max(np.abs(np.atleast_1d(a) - b)) for a, b in zip(single_l, batch_l)
+    )
+    print(f"single: {len(feat_3m_l) / single_sec:8.2f} tracks/sec")
+    print(f"batch : {len(feat_3m_l) / batch_sec:8.2f} tracks/sec")
+    print(f"speedup x{single_sec / batch_sec:.2f}, max novelty difference {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
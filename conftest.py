@@ -0,0 +1 @@
+# makes the repository root importable (utils, ssmnet, ...) when running pytest
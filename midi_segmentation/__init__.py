@@ -0,0 +1 @@
+"""Segmentation of MIDI files into loops, by time, by beat or by SSM novelty."""
@@ -0,0 +1,185 @@
+"""
+Segment every MIDI file of a folder and write the segments and their metadata.
+
+midi_segmentation data/inputs data/outputs/ssm --mode ssm --sr 2 -j 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pretty_midi
+
+from .utils.midi import NoteTable, Segmentation, SPLIT_POLICIES
+from .utils.naming import ssm_segment_name
+from . import segment
+
+from typing import Dict, List, Tuple
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+STAGES = ("load", "boundaries", "segment", "write")
+
+
+def segment_name(stem: str, mode: str, i: int, start: float, end: float, sr: float) -> str:
+    """File name of a segment, in the format of the segmentation notebooks."""
+    if mode == "ssm":
+        return ssm_segment_name(stem, i, sr)
+    if mode == "beat":
+        return f"{stem}_{round(start):03d}-{round(end):03d}.mid"
+    return f"{stem}_{round(start)}-{round(end)}.mid"
+
+
+def process_file(path: str, output_dir: str, options: Dict) -> Tuple[List[Dict], Dict[str, float]]:
+    """
+    Segment one MIDI file and write its segments. Runs in the worker processes.
+
+    Parameters:
+    path (str): Path to the MIDI file.
+    output_dir (str): The folder to write the segments to.
+    options (dict): The command line options.
+
+    Returns:
+    tuple: The metadata of every written segment, and the time spent in each stage.
+    """
+    timings = {}
+    stem = Path(path).stem
+
+    start_time = time.perf_counter()
+    midi = pretty_midi.PrettyMIDI(path)
+    notes = NoteTable.from_midi(midi)
+    end_time = midi.get_end_time()
+    timings["load"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    if options["mode"] == "time":
+        boundaries = segment.time_boundaries(end_time, options["segment_length"])
+    elif options["mode"] == "beat":
+        boundaries = segment.beat_boundaries(
+            end_time, options["bpm"], options["beats_per_segment"]
+        )
+    else:
+        boundaries = segment.ssm_boundaries(
+            notes, end_time, options["sr"], options["L"], options["peak_settings"]
+        )
+    timings["boundaries"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    # the last boundary is the end of the last segment, not the start of a new one
+    segmentation = Segmentation(notes, boundaries, options["policy"])
+    segments = [
+        (i, *segmentation.span(i), segmentation.segment(i))
+        for i in range(len(boundaries) - 1)
+    ]
+    timings["segment"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    metadata = []
+    for i, seg_start, seg_end, seg_notes in segments:
+        if len(seg_notes) == 0:
+            continue
+        # segment_midi_beat.ipynb drops segments whose rounded bounds (its file
+        # name) are equal; time and ssm segments are kept whatever their length
+        if options["mode"] == "beat" and round(seg_start) == round(seg_end):
+            continue
+        name = segment_name(stem, options["mode"], i, seg_start, seg_end, options["sr"])
+        segmentation.write(i, os.path.join(output_dir, name), midi.instruments)
+        metadata.append(
+            {
+                "file": name,
+                "parent": stem,
+                "section": len(metadata) + 1,
+                "start": seg_start,
+                "end": seg_end,
+                "num_notes": len(seg_notes),
+            }
+        )
+    timings["write"] = time.perf_counter() - start_time
+
+    return metadata, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Segment every MIDI file of a folder by time, beat or SSM novelty"
+    )
+    parser.add_argument("input_dir", help="folder of MIDI files")
+    parser.add_argument("output_dir", help="folder to write the segments to")
+    parser.add_argument("-m", "--mode", choices=segment.MODES, default="time")
+    parser.add_argument(
+        "--segment_length", type=float, default=8, help="[time] segment length in seconds"
+    )
+    parser.add_argument("--bpm", type=float, default=120, help="[beat] tempo")
+    parser.add_argument(
+        "--beats_per_segment", type=int, default=8, help="[beat] beats per segment"
+    )
+    parser.add_argument("--sr", type=float, default=2, help="[ssm] chroma frame rate")
+    parser.add_argument("--L", type=int, default=1, help="[ssm] novelty kernel half size")
+    parser.add_argument(
+        "--peak_settings",
+        type=json.loads,
+        default={},
+        help='[ssm] JSON peak picking settings, e.g. \'{"Thalf": 10, "tau": 1.35, "distance": 7}\'',
+    )
+    parser.add_argument(
+        "--policy",
+        choices=SPLIT_POLICIES,
+        default="clip",
+        help="notes sounding past the end of their segment",
+    )
+    parser.add_argument(
+        "--metadata",
+        default="segments.json",
+        help="metadata file name, written in output_dir",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    args = parser.parse_args()
+    options = vars(args)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = sorted(
+        os.path.join(args.input_dir, filename)
+        for filename in os.listdir(args.input_dir)
+        if filename.lower().endswith(MIDI_EXTENSIONS)
+    )
+
+    start_time = time.perf_counter()
+    metadata = []
+    total_timings = dict.fromkeys(STAGES, 0.0)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(process_file, path, args.output_dir, options): path
+            for path in paths
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                file_metadata, timings = future.result()
+            except Exception as e:  # a broken file must not stop the batch
+                print(f"skipping {path}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            metadata.extend(file_metadata)
+            for stage, duration in timings.items():
+                total_timings[stage] += duration
+            print(f"[{i}/{len(paths)}] {Path(path).name} -> {len(file_metadata)} segments")
+
+    metadata.sort(key=lambda m: (m["parent"], m["section"]))
+    with open(os.path.join(args.output_dir, args.metadata), "w", encoding="utf-8") as f:
+        json.dump({"options": options, "segments": metadata}, f, indent=2)
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"wrote {len(metadata)} segments of {len(paths)} files in {elapsed:.1f}s "
+        f"({len(paths) / max(elapsed, 1e-9):.1f} files/s)"
+    )
+    print("time per stage (summed over workers): " + ", ".join(
+        f"{stage} {total_timings[stage]:.2f}s" for stage in STAGES
+    ))
+
+
+if __name__ == "__main__":
+    main()
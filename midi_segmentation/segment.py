@@ -0,0 +1,85 @@
+"""
+Segment boundaries of a MIDI file, for each segmentation mode.
+
+Every function returns the segment start times in seconds, followed by the end
+of the last segment.
+"""
+import numpy as np
+
+from . import ssm_utils
+from .utils.midi import NoteTable, chroma_from_notes
+
+from typing import Dict, Optional
+
+MODES = ("time", "beat", "ssm")
+
+
+def time_boundaries(end_time: float, segment_length: float = 8) -> np.ndarray:
+    """
+    Fixed-length segments, as in segment_midi_time.ipynb.
+
+    Parameters:
+    end_time (float): The end time of the file in seconds.
+    segment_length (float): The segment length in seconds.
+
+    Returns:
+    np.ndarray: The boundaries in seconds.
+    """
+    return np.append(np.arange(0, end_time, segment_length), end_time)
+
+
+def beat_boundaries(
+    end_time: float, bpm: float = 120, beats_per_segment: int = 8
+) -> np.ndarray:
+    """
+    Segments of a fixed number of beats, as in segment_midi_beat.ipynb. The
+    last segment ends at end_time; if less than a beat is left after the last
+    whole segment, it is merged into that segment.
+
+    Parameters:
+    end_time (float): The end time of the file in seconds.
+    bpm (float): The tempo in beats per minute.
+    beats_per_segment (int): The number of beats in each segment.
+
+    Returns:
+    np.ndarray: The boundaries in seconds.
+    """
+    beat_duration = 60.0 / bpm
+    boundaries = np.arange(0, end_time, beat_duration * beats_per_segment)
+    if len(boundaries) > 1 and end_time - boundaries[-1] < beat_duration:
+        boundaries = boundaries[:-1]
+    return np.append(boundaries, end_time)
+
+
+def ssm_boundaries(
+    notes: NoteTable,
+    end_time: float,
+    sr: float = 2,
+    L: int = 1,
+    peak_settings: Optional[Dict] = None,
+) -> np.ndarray:
+    """
+    Segments between the peaks of the chroma SSM novelty curve, as in
+    segment_midi_ssm.ipynb. Only the band of the SSM read by the novelty
+    kernel is computed.
+
+    Parameters:
+    notes (NoteTable): The notes of the file.
+    end_time (float): The end time of the file in seconds.
+    sr (float): The chroma frame rate in frames per second.
+    L (int): The novelty kernel size is 2*L+1 frames.
+    peak_settings (dict): Thalf, tau and distance for ssm_utils.get_boundaries.
+
+    Returns:
+    np.ndarray: The boundaries in seconds.
+    """
+    chroma = chroma_from_notes(notes, sr, num_frames=int(sr * end_time))
+    ssm = ssm_utils.BandedSSM.from_features(chroma, 2 * L)
+    novelty = ssm_utils.compute_novelty_ssm(ssm, L=L, exclude=True)
+    boundary_frames, _ = ssm_utils.get_boundaries(
+        novelty, np.arange(chroma.shape[1], dtype=np.float64), peak_settings or {}
+    )
+    boundaries = boundary_frames / sr
+    # the last chroma frame starts before the end of the file
+    boundaries[-1] = max(boundaries[-1], end_time)
+    return boundaries
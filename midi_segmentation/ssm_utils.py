@@ -0,0 +1,371 @@
+"""Helpful tools for generating self-similarity matrices"""
+
+import numpy as np
+from scipy import signal
+
+import numpy.typing as npt
+from typing import Tuple, Dict
+
+from ssmnet.peaks import f_pick_peaks
+
+
+def boundary_split(array, indices):
+    """chatgpt-generated"""
+    # Check if the indices are valid
+    if any(index < 0 or index > len(array) for index in indices):
+        raise ValueError("Invalid index in the list.")
+
+    # Add the start and end indices to the list
+    split_indices = [0] + sorted(indices) + [len(array)]
+
+    # Create subarrays using slicing
+    subarrays = [
+        array[int(split_indices[i]) : int(split_indices[i + 1])]
+        for i in range(len(split_indices) - 1)
+    ]
+
+    return subarrays
+
+
+def boundary_split_t(array, times):
+    """Group notes by the segment (between consecutive boundary times) they start in.
+
+    Notes are assigned with a binary search over the sorted boundary times, in
+    O(n log b). Segment i spans ``[times[i], times[i + 1])``, the last segment is
+    open ended, and notes starting before the first boundary are dropped. For a
+    copy-free version working on note arrays, see ``utils.midi.Segmentation``.
+
+    Args:
+        array (list): ``pretty_midi.Note`` objects
+        times (np.ndarray): Boundary times in seconds
+
+    Returns:
+        subarrays (dict): Notes of each segment, keyed by ``int(start time)``
+    """
+    subarrays = {}
+    for t in times:
+        subarrays[int(t)] = []
+    times = np.sort(np.asarray(times, dtype=np.float64))
+
+    starts = np.array([note.start for note in array], dtype=np.float64)
+    segments = np.searchsorted(times, starts, side="right") - 1
+    for note, i in zip(array, segments):
+        if i >= 0:
+            subarrays[int(times[i])].append(note)
+
+    return subarrays
+
+
+class BandedSSM:
+    """Self-similarity matrix stored as its diagonal band only.
+
+    ``band[d + width, n] == S[n, n + d]`` for offsets d in -width..width, zero
+    where ``n + d`` is out of range. Memory is O(N*width) instead of O(N^2),
+    which is all that checkerboard novelty with width >= 2L needs.
+    """
+
+    def __init__(self, band, width):
+        self.band = band
+        self.width = width
+
+    @classmethod
+    def from_features(cls, features, width):
+        """Compute the band of ``features.T @ features`` without the dense SSM.
+
+        Args:
+            features (np.ndarray): Feature sequence of size D x N
+            width (int): Largest diagonal offset to keep
+
+        Returns:
+            ssm (BandedSSM)
+        """
+        N = features.shape[1]
+        band = np.zeros(
+            (2 * width + 1, N), dtype=np.result_type(features.dtype, np.float32)
+        )
+        for d in range(min(width, N - 1) + 1):
+            diagonal = np.einsum("ij,ij->j", features[:, : N - d], features[:, d:])
+            band[width + d, : N - d] = diagonal
+            # the SSM is symmetric: S[n, n - d] == S[n - d, n]
+            band[width - d, d:] = diagonal
+
+        return cls(band, width)
+
+    @classmethod
+    def from_dense(cls, S, width):
+        """Keep the diagonals -width..width of a dense SSM."""
+        return cls(get_ssm_band(S, width), width)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.band.shape[1], self.band.shape[1])
+
+    def to_dense(self) -> npt.NDArray[np.float64]:
+        """Dense N x N matrix (zero outside the band), e.g. for plotting."""
+        N = self.band.shape[1]
+        S = np.zeros((N, N), dtype=self.band.dtype)
+        rows = np.arange(N)
+        for d in range(-min(self.width, N - 1), min(self.width, N - 1) + 1):
+            r = rows[max(0, -d) : N - max(0, d)]
+            S[r, r + d] = self.band[d + self.width, r]
+
+        return S
+
+
+def gen_ssm_and_novelty(
+    features,
+    L=1,
+    filter_length=41,
+    down_sampling=10,
+    hop=1024,
+    sr=44100,
+    dense=True,
+):
+    features, _ = smooth_downsample_feature_sequence(
+        features, sr / hop, filter_length, down_sampling
+    )
+
+    print(features.shape)
+
+    if dense:
+        ssm = np.dot(np.transpose(features), features)
+    else:
+        # only the band read by the novelty kernel, use ssm.to_dense() to plot
+        ssm = BandedSSM.from_features(features, 2 * L)
+    novelty = compute_novelty_ssm(ssm, L=L, exclude=True)
+
+    return ssm, novelty
+
+
+def get_peaks(data: npt.NDArray, Thalf=10, tau=1.35, distance=7):
+    """from SSMNet"""
+
+    return f_pick_peaks(data, Thalf, tau, distance)
+
+
+def get_boundaries(
+    novelty: npt.NDArray[np.float64],
+    time_sec_v: npt.NDArray[np.float64],
+    peak_settings: Dict = {},
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Estimate the boundaries using the novelty curve.
+
+    Args:
+        novelty: the novelty curve
+        time_sec_v: an array of seconds indicators
+        peak_settings: custom settings for peak detection
+
+    Returns:
+        boundary_sec_v: boundary indices in seconds
+        boundary_frame_v: boundary indices in frames
+    """
+    if len(peak_settings.values()) > 0:
+        boundary_frame_v = get_peaks(
+            novelty,
+            peak_settings["Thalf"],
+            peak_settings["tau"],
+            peak_settings["distance"],
+        )
+    else:
+        boundary_frame_v = get_peaks(
+            novelty,
+        )
+    boundary_sec_v = time_sec_v[boundary_frame_v]
+
+    # add start and end-time
+    boundary_sec_v = np.concatenate(
+        (0 * np.ones(1), boundary_sec_v, time_sec_v[-1] * np.ones(1))
+    )
+
+    # to be sure there is not twice zero
+    boundary_sec_v = np.array(sorted([aaa for aaa in set(boundary_sec_v)]))
+
+    return boundary_sec_v, boundary_frame_v
+
+
+def compute_novelty_ssm(
+    S, kernel=None, L=10, var=0.5, exclude=False
+) -> npt.NDArray[np.float64]:
+    """Compute novelty function from SSM [FMP, Section 4.4.1]
+
+    Same result as ``compute_novelty_ssm_naive``, but only the diagonal band of
+    ``S`` that the kernel overlaps (offsets -2L..2L) is read, and the kernel is
+    applied along each diagonal with a 1D correlation. Cost is O(N*M^2) in
+    vectorized operations and O(N*L) extra memory.
+
+    Args:
+        S (np.ndarray or BandedSSM): SSM (a BandedSSM needs a width of at least 2L)
+        kernel (np.ndarray): Checkerboard kernel (if kernel==None, it will be computed) (Default value = None)
+        L (int): Parameter specifying the kernel size M=2*L+1 (Default value = 10)
+        var (float): Variance parameter determing the tapering (epsilon) (Default value = 0.5)
+        exclude (bool): Sets the first L and last L values of novelty function to zero (Default value = False)
+
+    Returns:
+        nov (np.ndarray): Novelty function
+    """
+    if kernel is None:
+        kernel = compute_kernel_checkerboard_gaussian(L=L, var=var)
+    N = S.shape[0]
+    band = S.band if isinstance(S, BandedSSM) else get_ssm_band(S, 2 * L)
+    nov = novelty_from_band(band, kernel, L)
+    if exclude:
+        right = np.min([L, N])
+        left = np.max([0, N - L])
+        nov[0:right] = 0
+        nov[left:N] = 0
+
+    return nov
+
+
+def compute_novelty_ssm_naive(
+    S, kernel=None, L=10, var=0.5, exclude=False
+) -> npt.NDArray[np.float64]:
+    """Compute novelty function from SSM [FMP, Section 4.4.1]
+
+    Reference implementation, one kernel multiplication per frame on a padded
+    copy of ``S``. Kept to check and benchmark ``compute_novelty_ssm``.
+
+    Notebook: C4/C4S4_NoveltySegmentation.ipynb
+
+    Args:
+        S (np.ndarray): SSM
+        kernel (np.ndarray): Checkerboard kernel (if kernel==None, it will be computed) (Default value = None)
+        L (int): Parameter specifying the kernel size M=2*L+1 (Default value = 10)
+        var (float): Variance parameter determing the tapering (epsilon) (Default value = 0.5)
+        exclude (bool): Sets the first L and last L values of novelty function to zero (Default value = False)
+
+    Returns:
+        nov (np.ndarray): Novelty function
+    """
+    if kernel is None:
+        kernel = compute_kernel_checkerboard_gaussian(L=L, var=var)
+    N = S.shape[0]
+    M = 2 * L + 1
+    nov = np.zeros(N)
+    # np.pad does not work with numba/jit
+    S_padded = np.pad(S, L, mode="constant")
+
+    for n in range(N):
+        # Does not work with numba/jit
+        nov[n] = np.sum(S_padded[n : n + M, n : n + M] * kernel)
+    if exclude:
+        right = np.min([L, N])
+        left = np.max([0, N - L])
+        nov[0:right] = 0
+        nov[left:N] = 0
+
+    return nov
+
+
+def get_ssm_band(S, width) -> npt.NDArray[np.float64]:
+    """Extract the diagonals of an SSM with offsets -width..width.
+
+    Args:
+        S (np.ndarray): SSM of size N x N
+        width (int): Largest diagonal offset to keep
+
+    Returns:
+        band (np.ndarray): Array of size (2*width+1) x N with
+            ``band[d + width, n] == S[n, n + d]``, zero where ``n + d`` is out of range
+    """
+    N = S.shape[0]
+    band = np.zeros((2 * width + 1, N), dtype=np.result_type(S.dtype, np.float64))
+    for d in range(-min(width, N - 1), min(width, N - 1) + 1):
+        diagonal = np.diagonal(S, offset=d)
+        if d >= 0:
+            band[d + width, : N - d] = diagonal
+        else:
+            band[d + width, -d:] = diagonal
+
+    return band
+
+
+def novelty_from_band(band, kernel, L) -> npt.NDArray[np.float64]:
+    """Apply a (2L+1) x (2L+1) kernel along the main diagonal of a banded SSM.
+
+    Equivalent to summing ``kernel * S[n-L:n+L+1, n-L:n+L+1]`` (zero-padded) for
+    every frame ``n``: each diagonal of the kernel is correlated with the
+    matching diagonal of the SSM.
+
+    Args:
+        band (np.ndarray): Banded SSM as returned by ``get_ssm_band``, of width >= 2L
+        kernel (np.ndarray): Kernel matrix of size M x M with M=2*L+1
+        L (int): Parameter specifying the kernel size M=2*L+1
+
+    Returns:
+        nov (np.ndarray): Novelty function
+    """
+    width = (band.shape[0] - 1) // 2
+    N = band.shape[1]
+    M = 2 * L + 1
+    if width < M - 1:
+        raise ValueError(f"Band of width {width} is too narrow for L={L}.")
+    nov = np.zeros(N)
+    padded = np.zeros(N + 2 * L)
+    for d in range(-(M - 1), M):
+        kernel_diagonal = np.diagonal(kernel, offset=d)
+        start = max(0, -d)
+        padded[L : L + N] = band[d + width]
+        nov += signal.correlate(
+            padded[start : start + N + len(kernel_diagonal) - 1],
+            kernel_diagonal,
+            mode="valid",
+        )
+
+    return nov
+
+
+# Built once per novelty curve: compiling it with numba took seconds in every
+# process, for a kernel that numpy builds in microseconds.
+def compute_kernel_checkerboard_gaussian(
+    L, var=1.0, normalize=True
+) -> npt.NDArray[np.float64]:
+    """Compute Guassian-like checkerboard kernel [FMP, Section 4.4.1].
+    See also: https://scipython.com/blog/visualizing-the-bivariate-gaussian-distribution/
+
+    Notebook: C4/C4S4_NoveltySegmentation.ipynb
+
+    Args:
+        L (int): Parameter specifying the kernel size M=2*L+1
+        var (float): Variance parameter determing the tapering (epsilon) (Default value = 1.0)
+        normalize (bool): Normalize kernel (Default value = True)
+
+    Returns:
+        kernel (np.ndarray): Kernel matrix of size M x M
+    """
+    taper = np.sqrt(1 / 2) / (L * var)
+    axis = np.arange(-L, L + 1)
+    gaussian1D = np.exp(-(taper**2) * (axis**2))
+    gaussian2D = np.outer(gaussian1D, gaussian1D)
+    kernel_box = np.outer(np.sign(axis), np.sign(axis))
+    kernel = kernel_box * gaussian2D
+
+    if normalize:
+        kernel = kernel / np.sum(np.abs(kernel))
+
+    return kernel
+
+
+def smooth_downsample_feature_sequence(
+    X, Fs, filt_len=41, down_sampling=10, w_type="boxcar"
+):
+    """Smoothes and downsamples a feature sequence. Smoothing is achieved by convolution with a filter kernel
+
+    Notebook: C3/C3S1_FeatureSmoothing.ipynb
+
+    Args:
+        X (np.ndarray): Feature sequence
+        Fs (scalar): Frame rate of ``X``
+        filt_len (int): Length of smoothing filter (Default value = 41)
+        down_sampling (int): Downsampling factor (Default value = 10)
+        w_type (str): Window type of smoothing filter (Default value = 'boxcar')
+
+    Returns:
+        X_smooth (np.ndarray): Smoothed and downsampled feature sequence
+        Fs_feature (scalar): Frame rate of ``X_smooth``
+    """
+    filt_kernel = np.expand_dims(signal.get_window(w_type, filt_len), axis=0)
+    X_smooth = signal.convolve(X, filt_kernel, mode="same") / filt_len
+    X_smooth = X_smooth[:, ::down_sampling]
+    Fs_feature = Fs / down_sampling
+    return X_smooth, Fs_feature
@@ -0,0 +1,330 @@
+"""
+Build the descriptor of every MIDI segment of a folder (schema in loop_desc.json).
+
+The all_metrics output of each file is kept in a persistent index, keyed by file
+name, mtime, size and content hash, along with the all_metrics configuration.
+Re-runs only recompute new or changed files and drop deleted ones.
+
+Usage (from the repository root):
+python -m midi_segmentation.utils.corpus "data/trimmed outputs" -o data/loop_desc.json -j 8 \
+    --metrics_json data/outputs/midi_metrics.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pretty_midi
+
+from .midi import all_metrics
+from .naming import parse_segment_name
+
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CONFIG = {
+    "w1": 0.5,
+    "w2": 0.5,
+    "bin_length": 1.0,
+    "ph_weight_dur": False,
+    "ph_weight_vel": False,
+}
+MIDI_EXTENSIONS = (".mid", ".midi")
+INDEX_VERSION = 1
+
+
+def find_segments(folder: str) -> list[str]:
+    """
+    List the MIDI files of a folder (not recursive).
+
+    Parameters:
+    folder (str): The folder to scan.
+
+    Returns:
+    list: The sorted file names.
+    """
+    return sorted(
+        entry.name
+        for entry in os.scandir(folder)
+        if entry.is_file() and entry.name.lower().endswith(MIDI_EXTENSIONS)
+    )
+
+
+def compute_metrics(path: str, config: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Load a MIDI file and run all_metrics on it. Runs in the worker processes.
+
+    Parameters:
+    path (str): Path to the MIDI file.
+    config (dict): The all_metrics configuration.
+
+    Returns:
+    tuple: The metrics and None, or None and an error message.
+    """
+    try:
+        return all_metrics(pretty_midi.PrettyMIDI(path), config), None
+    except Exception as e:  # a broken file must not stop the whole corpus
+        return None, f"{type(e).__name__}: {e}"
+
+
+def build_descriptors(metrics: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Turn all_metrics outputs into loop_desc.json descriptors.
+
+    Parameters:
+    metrics (dict): The all_metrics output of each segment, keyed by file name.
+
+    Returns:
+    dict: The descriptor of each segment, keyed by file name. Sections are
+    numbered from 1 in order of position within each parent.
+    """
+    positions = {filename: parse_segment_name(filename) for filename in metrics}
+    order = sorted(metrics, key=lambda filename: (positions[filename], filename))
+
+    descriptors = {}
+    sections = {}
+    for filename in order:
+        parent = positions[filename][0]
+        sections[parent] = sections.get(parent, 0) + 1
+        m = metrics[filename]
+        descriptors[filename] = {
+            "parent": parent,
+            "section": sections[parent],
+            "histogram": m["pitch_histogram"],
+            "tempo": m["tempo"],
+            "energy": float(np.mean(m["energies"])) if m["energies"] else 0.0,
+            "avg_note_len": m["lengths"],
+            "num_notes": m["note_count"],
+            "length": m["file_len"],
+        }
+
+    return descriptors
+
+
+def compute_all_metrics(
+    folder: str, filenames: list[str], config: Dict, workers: Optional[int] = None
+) -> Dict[str, Dict]:
+    """
+    Run all_metrics on many files with a process pool, showing progress.
+
+    Parameters:
+    folder (str): The folder holding the files.
+    filenames (list): The file names to process.
+    config (dict): The all_metrics configuration.
+    workers (int): Number of worker processes (default: number of CPUs).
+
+    Returns:
+    dict: The metrics of every file that could be processed, keyed by file name.
+    """
+    metrics = {}
+    if not filenames:
+        return metrics
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(filenames) // (workers * 16))
+    paths = [os.path.join(folder, filename) for filename in filenames]
+    start_time = time.perf_counter()
+    last_report = 0.0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            partial(compute_metrics, config=config), paths, chunksize=chunksize
+        )
+        for i, (filename, (m, error)) in enumerate(zip(filenames, results), 1):
+            if error is None:
+                metrics[filename] = m
+            else:
+                print(f"\nskipping {filename}: {error}", file=sys.stderr)
+
+            elapsed = time.perf_counter() - start_time
+            if elapsed - last_report > 0.5 or i == len(filenames):
+                last_report = elapsed
+                print(
+                    f"\r[{i}/{len(filenames)}] {i / elapsed:.0f} files/s",
+                    end="",
+                    flush=True,
+                )
+    print()
+
+    return metrics
+
+
+def file_digest(path: str) -> str:
+    """
+    Parameters:
+    path (str): Path to the file.
+
+    Returns:
+    str: The SHA-1 of the file content.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_index(path: str, folder: str, config: Dict) -> Dict:
+    """
+    Load a metrics index, or start an empty one if it does not exist or was
+    built for another folder, another configuration or another index version.
+
+    Parameters:
+    path (str): Path to the index file.
+    folder (str): The folder of MIDI segments.
+    config (dict): The all_metrics configuration.
+
+    Returns:
+    dict: The index.
+    """
+    empty = {
+        "version": INDEX_VERSION,
+        "folder": os.path.abspath(folder),
+        "config": config,
+        "entries": {},
+    }
+    if not os.path.exists(path):
+        return empty
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if any(index.get(k) != empty[k] for k in ("version", "folder", "config")):
+        print(f"{path} was built for another folder or configuration, rebuilding")
+        return empty
+    return index
+
+
+def save_index(index: Dict, path: str):
+    """
+    Write the index atomically, so an interrupted run never leaves it corrupt.
+
+    Parameters:
+    index (dict): The index.
+    path (str): Path to the index file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def update_index(index: Dict, workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Bring an index up to date with its folder. Files whose mtime and size are
+    unchanged are trusted, other files are hashed and only recomputed if their
+    content changed.
+
+    Parameters:
+    index (dict): The index, as returned by load_index. Updated in place.
+    workers (int): Number of worker processes (default: number of CPUs).
+
+    Returns:
+    dict: The number of unchanged, recomputed and deleted files.
+    """
+    folder = index["folder"]
+    entries = index["entries"]
+    filenames = find_segments(folder)
+
+    stale = {}
+    for filename in filenames:
+        stat = os.stat(os.path.join(folder, filename))
+        entry = entries.get(filename)
+        if (
+            entry is not None
+            and entry["mtime"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            continue
+        digest = file_digest(os.path.join(folder, filename))
+        if entry is not None and entry["sha1"] == digest:
+            entry["mtime"] = stat.st_mtime_ns
+            entry["size"] = stat.st_size
+            continue
+        stale[filename] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": digest,
+        }
+
+    deleted = set(entries) - set(filenames)
+    for filename in deleted:
+        del entries[filename]
+
+    metrics = compute_all_metrics(folder, list(stale), index["config"], workers)
+    for filename, entry in stale.items():
+        # files that failed are kept with no metrics, so they are only retried once changed
+        entry["metrics"] = metrics.get(filename)
+        entries[filename] = entry
+
+    return {
+        "unchanged": len(filenames) - len(stale),
+        "recomputed": len(stale),
+        "deleted": len(deleted),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the loop_desc.json descriptor of every MIDI segment in a folder"
+    )
+    parser.add_argument("folder", help="folder of MIDI segments")
+    parser.add_argument(
+        "-o", "--output", default="loop_desc.json", help="output JSON file"
+    )
+    parser.add_argument(
+        "--metrics_json",
+        help="also write all_metrics outputs in the midi_metrics.json format read by looper.js",
+    )
+    parser.add_argument(
+        "--index",
+        help="persistent metrics index (default: OUTPUT with an .index.json suffix)",
+    )
+    parser.add_argument(
+        "-c", "--config", help="JSON file with the all_metrics configuration"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    args = parser.parse_args()
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+    index_path = args.index or f"{os.path.splitext(args.output)[0]}.index.json"
+
+    start_time = time.perf_counter()
+    index = load_index(index_path, args.folder, config)
+    counts = update_index(index, args.workers)
+    save_index(index, index_path)
+
+    metrics = {
+        filename: entry["metrics"]
+        for filename, entry in index["entries"].items()
+        if entry["metrics"] is not None
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(build_descriptors(metrics), f)
+    if args.metrics_json:
+        with open(args.metrics_json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    filename: {"notes": [], "metrics": m, "played": 0}
+                    for filename, m in metrics.items()
+                },
+                f,
+            )
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"{counts['unchanged']} unchanged, {counts['recomputed']} recomputed, "
+        f"{counts['deleted']} deleted; wrote {len(metrics)} descriptors to "
+        f"{args.output} in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Append-only, memory-mappable store of fixed-shape segment features (e.g. the
+piano rolls that segment_midi_beat.ipynb saves to all_loops.npz).
+
+A store is a folder holding:
+- features.bin: the arrays, back to back, in C order
+- index.json: their shape and dtype, and the name, parent and byte offset of each
+
+Reading one segment maps the file instead of decompressing the whole archive.
+
+    store = FeatureStore.create("data/npzs/all_loops", shape=(58, 401))
+    store.append(name, piano_roll, parent=parent)
+    store.flush()
+    rolls = FeatureStore("data/npzs/all_loops").array()  # np.memmap (n, 58, 401)
+
+Convert an existing archive with:
+python -m midi_segmentation.utils.feature_store data/npzs/all_loops.npz data/npzs/all_loops
+"""
+import argparse
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from .naming import parse_segment_name
+
+from typing import Dict, Optional, Tuple
+
+DATA_FILE = "features.bin"
+INDEX_FILE = "index.json"
+
+
+class FeatureStore:
+    """
+    Parameters:
+    path (str): The store folder, created with FeatureStore.create.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.shape = tuple(index["shape"])
+        self.dtype = np.dtype(index["dtype"])
+        self.names = index["names"]
+        self.parents = index["parents"]
+        self.offsets = index["offsets"]
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.item_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @classmethod
+    def create(cls, path: str, shape: Tuple[int, ...], dtype="float32") -> "FeatureStore":
+        """
+        Create an empty store.
+
+        Parameters:
+        path (str): The store folder (created if needed, must not hold a store).
+        shape (tuple): The shape of every array.
+        dtype (str): The type of every array, e.g. float32 or uint8.
+
+        Returns:
+        FeatureStore: The empty store.
+        """
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileExistsError(f"{path} already holds a feature store.")
+        open(os.path.join(path, DATA_FILE), "wb").close()
+        cls._write_index(path, shape, np.dtype(dtype), [], [], [])
+        return cls(path)
+
+    @staticmethod
+    def _write_index(path, shape, dtype, names, parents, offsets):
+        tmp_path = os.path.join(path, f"{INDEX_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "shape": list(shape),
+                    "dtype": dtype.str,
+                    "names": names,
+                    "parents": parents,
+                    "offsets": offsets,
+                },
+                f,
+            )
+        os.replace(tmp_path, os.path.join(path, INDEX_FILE))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.positions
+
+    def append(self, name: str, array: np.ndarray, parent: Optional[str] = None):
+        """
+        Add an array at the end of the store. Call flush() to save the index.
+
+        Parameters:
+        name (str): The segment name, must be new.
+        array (np.ndarray): The features, of the store shape.
+        parent (str): The parent sequence (default: parsed from the name, see
+        utils.naming.parse_segment_name).
+        """
+        if name in self.positions:
+            raise KeyError(f"{name} is already in the store.")
+        if tuple(array.shape) != self.shape:
+            raise ValueError(f"{name} has shape {array.shape}, the store holds {self.shape}.")
+
+        offset = len(self) * self.item_bytes
+        with open(os.path.join(self.path, DATA_FILE), "r+b") as f:
+            f.seek(offset)
+            f.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+
+        self.positions[name] = len(self.names)
+        self.names.append(name)
+        self.parents.append(parent if parent is not None else parse_segment_name(name)[0])
+        self.offsets.append(offset)
+
+    def flush(self):
+        """Save the index. Data appended after the last flush is ignored on reopening."""
+        self._write_index(
+            self.path, self.shape, self.dtype, self.names, self.parents, self.offsets
+        )
+
+    def array(self) -> np.memmap:
+        """
+        Returns:
+        np.memmap: A read-only (n, *shape) view of every array in the store.
+        """
+        if len(self) == 0:
+            return np.zeros((0, *self.shape), dtype=self.dtype)
+        return np.memmap(
+            os.path.join(self.path, DATA_FILE),
+            dtype=self.dtype,
+            mode="r",
+            shape=(len(self), *self.shape),
+        )
+
+    def __getitem__(self, name: str) -> np.memmap:
+        """Read-only view of one array, read from disk on access."""
+        return np.memmap(
+            os.path.join(self.path, DATA_FILE),
+            dtype=self.dtype,
+            mode="r",
+            offset=self.offsets[self.positions[name]],
+            shape=self.shape,
+        )
+
+
+def npz_headers(npz_path: str) -> Dict[str, Tuple[Tuple[int, ...], np.dtype]]:
+    """
+    Read the shape and type of every array of an archive from the .npy headers,
+    without decompressing the data.
+
+    Parameters:
+    npz_path (str): The archive.
+
+    Returns:
+    dict: The shape and dtype of each array, keyed by name, in archive order.
+    """
+    headers = {}
+    with zipfile.ZipFile(npz_path) as archive:
+        for member in archive.namelist():
+            if not member.endswith(".npy"):
+                continue
+            with archive.open(member) as f:
+                if np.lib.format.read_magic(f) == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            headers[member[: -len(".npy")]] = (shape, dtype)
+    return headers
+
+
+def from_npz(npz_path: str, path: str, dtype="float32") -> FeatureStore:
+    """
+    Convert an archive of arrays (e.g. all_loops.npz) to a store. Arrays are
+    zero-padded to the largest shape in the archive, and decompressed once.
+
+    Parameters:
+    npz_path (str): The archive.
+    path (str): The new store folder.
+    dtype (str): The store type, it must hold the archive values without
+    changing their kind (e.g. float arrays need a float store).
+
+    Returns:
+    FeatureStore: The store.
+    """
+    headers = npz_headers(npz_path)
+    for name, (_, source_dtype) in headers.items():
+        if not np.can_cast(source_dtype, dtype, casting="same_kind"):
+            raise ValueError(
+                f"{name} is {source_dtype}, it would be truncated in a {np.dtype(dtype)} store."
+            )
+    shape = tuple(int(n) for n in np.max([shape for shape, _ in headers.values()], axis=0))
+
+    store = FeatureStore.create(path, shape, dtype)
+    with np.load(npz_path) as archive:
+        for name in headers:
+            array = archive[name]
+            padded = np.zeros(shape, dtype=store.dtype)
+            padded[tuple(slice(0, n) for n in array.shape)] = array
+            store.append(name, padded)
+    store.flush()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert an .npz archive of segment features to a feature store"
+    )
+    parser.add_argument("npz", help="archive, e.g. data/npzs/all_loops.npz")
+    parser.add_argument("store", help="new store folder")
+    parser.add_argument("--dtype", default="float32")
+    args = parser.parse_args()
+
+    store = from_npz(args.npz, args.store, args.dtype)
+    print(f"wrote {len(store)} arrays of shape {store.shape} to {args.store}")
+
+
+if __name__ == "__main__":
+    main()
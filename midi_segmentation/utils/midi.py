@@ -0,0 +1,660 @@
+import os
+import math
+import pretty_midi
+import numpy as np
+import scipy.sparse
+from pathlib import Path
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+
+from typing import Dict, Tuple
+
+#################################  plotting  ##################################
+def draw_midi(midi_file: str, labels: bool = False):
+    plt.style.use("dark_background")
+
+    midi = pretty_midi.PrettyMIDI(midi_file)
+
+    _, ax = plt.subplots(figsize=(12, 4))
+
+    for note in midi.instruments[0].notes:
+        rect = patches.Rectangle(
+            (note.start, note.pitch), note.end - note.start, 1, color="green"
+        )
+        ax.add_patch(rect)
+
+    if labels:
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("MIDI Note")
+    ax.set_yticks([])
+    ax.set_title(f"{Path(midi_file).stem}")
+
+    plt.box(False)
+    plt.ylim(20, 108)  # MIDI note range for a piano
+    plt.xlim(0, np.ceil(midi.instruments[0].notes[-1].end))
+    return plt.gcf()
+
+def draw_histogram(histogram, title='Pitch Histogram'):
+    plt.style.use("dark_background")
+    plt.bar(range(12), histogram)
+    plt.ylabel('Frequency')
+    plt.title(title)
+    plt.xticks(range(12), ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'])
+    plt.show()
+
+def draw_piano_roll(piano_roll, fs=100, title='Piano Roll'):
+    plt.style.use("dark_background")
+    plt.figure(figsize=(12, 8))
+    plt.imshow(piano_roll, aspect='auto', origin='lower', cmap='magma', interpolation='nearest')
+    plt.title(title)
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('MIDI Note Number')
+    plt.colorbar()
+
+    tick_spacing = 1
+    ticks = np.arange(0, len(piano_roll.T) / fs, tick_spacing)
+    plt.xticks(ticks * fs, labels=[f"{tick:.1f}" for tick in ticks])
+
+    plt.show()
+
+################################  note table  #################################
+class NoteTable:
+    """
+    Structure-of-arrays copy of every note in a MIDI file, built once per file so
+    that metrics can be computed with array operations instead of per-note loops.
+
+    Attributes:
+    start (np.ndarray): Note onsets in seconds.
+    end (np.ndarray): Note offsets in seconds.
+    pitch (np.ndarray): MIDI note numbers.
+    velocity (np.ndarray): Note velocities.
+    instrument (np.ndarray): Index of each note's instrument in midi.instruments.
+    is_drum (np.ndarray): Whether each note belongs to a drum instrument
+    (default: no drums).
+    """
+
+    def __init__(self, start, end, pitch, velocity, instrument, is_drum=None):
+        self.start = start
+        self.end = end
+        self.pitch = pitch
+        self.velocity = velocity
+        self.instrument = instrument
+        self.is_drum = np.zeros(len(start), dtype=bool) if is_drum is None else is_drum
+
+    @classmethod
+    def from_midi(cls, midi: pretty_midi.PrettyMIDI) -> "NoteTable":
+        """
+        Collect the notes of every instrument of a MIDI file.
+
+        Parameters:
+        midi (PrettyMIDI): The prettyMIDI container object for the MIDI file.
+
+        Returns:
+        NoteTable: The notes, in instrument order then in the order they are stored.
+        """
+        count = sum(len(instrument.notes) for instrument in midi.instruments)
+        start = np.empty(count, dtype=np.float64)
+        end = np.empty(count, dtype=np.float64)
+        pitch = np.empty(count, dtype=np.int16)
+        velocity = np.empty(count, dtype=np.int16)
+        instrument_index = np.empty(count, dtype=np.int16)
+        is_drum = np.empty(count, dtype=bool)
+
+        i = 0
+        for j, instrument in enumerate(midi.instruments):
+            n = len(instrument.notes)
+            start[i : i + n] = [note.start for note in instrument.notes]
+            end[i : i + n] = [note.end for note in instrument.notes]
+            pitch[i : i + n] = [note.pitch for note in instrument.notes]
+            velocity[i : i + n] = [note.velocity for note in instrument.notes]
+            instrument_index[i : i + n] = j
+            is_drum[i : i + n] = instrument.is_drum
+            i += n
+
+        return cls(start, end, pitch, velocity, instrument_index, is_drum)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def __getitem__(self, index) -> "NoteTable":
+        """Select notes; a slice gives views into the same arrays, no copy."""
+        return NoteTable(
+            self.start[index],
+            self.end[index],
+            self.pitch[index],
+            self.velocity[index],
+            self.instrument[index],
+            self.is_drum[index],
+        )
+
+    def sorted(self) -> "NoteTable":
+        """The same notes sorted by onset (ties keep their order)."""
+        return self[np.argsort(self.start, kind="stable")]
+
+    def average_length(self) -> float:
+        """
+        Returns:
+        float: The average length of the notes in seconds, 0 if there are none.
+        """
+        return float(np.mean(self.end - self.start)) if len(self) else 0.0
+
+    def bin_sums(self, bin_length: float, num_bins: int, weights=None) -> np.ndarray:
+        """
+        Sum a per-note value over every time bin each note touches.
+
+        A note from start to end touches bins start // bin_length to
+        end // bin_length (clipped to num_bins). The sums are accumulated in a
+        difference array, so the cost does not depend on note durations.
+
+        Parameters:
+        bin_length (float): The length of time each bin occupies.
+        num_bins (int): The number of bins.
+        weights (np.ndarray): The value of each note (default 1, i.e. count notes).
+
+        Returns:
+        np.ndarray: The sum of weights of the notes touching each bin.
+        """
+        if weights is None:
+            weights = np.ones(len(self), dtype=np.int64)
+        start_bin = (self.start // bin_length).astype(np.int64)
+        end_bin = np.minimum((self.end // bin_length).astype(np.int64), num_bins - 1)
+        touches = start_bin <= end_bin
+
+        diff = np.zeros(num_bins + 1, dtype=np.result_type(weights, np.int64))
+        np.add.at(diff, start_bin[touches], weights[touches])
+        np.add.at(diff, end_bin[touches] + 1, -weights[touches])
+
+        return np.cumsum(diff[:-1])
+
+
+################################  features  ###################################
+def _render(rows, start, end, weights, num_rows, num_frames, dtype, sparse):
+    """Add weights[k] to out[rows[k], start[k]:end[k]] for every note k."""
+    end = np.minimum(end, num_frames)
+    sounding = start < end
+    rows, start, end, weights = rows[sounding], start[sounding], end[sounding], weights[sounding]
+
+    if sparse:
+        lengths = end - start
+        first = np.cumsum(lengths) - lengths
+        frames = np.repeat(start - first, lengths) + np.arange(lengths.sum())
+        return scipy.sparse.csr_matrix(
+            (np.repeat(weights, lengths).astype(dtype), (np.repeat(rows, lengths), frames)),
+            shape=(num_rows, num_frames),
+        )
+
+    # difference array along time, then one cumulative sum in place
+    out = np.zeros((num_rows, num_frames + 1), dtype=dtype)
+    np.add.at(out, (rows, start), weights)
+    np.add.at(out, (rows, end), -weights)
+    np.cumsum(out, axis=1, out=out)
+    return out[:, :num_frames]
+
+
+def _frames(notes: NoteTable, fs: float, num_frames):
+    start = (notes.start * fs).astype(np.int64)
+    end = (notes.end * fs).astype(np.int64)
+    if num_frames is None:
+        num_frames = int(fs * notes.end.max()) if len(notes) else 0
+    return start, end, num_frames
+
+
+def piano_roll_from_notes(
+    notes: NoteTable,
+    fs: float = 100,
+    pitch_range: Tuple[int, int] = (0, 128),
+    num_frames=None,
+    dtype=np.float32,
+    sparse: bool = False,
+):
+    """
+    Render a piano roll straight from note arrays, only for the requested pitches.
+
+    Same values as PrettyMIDI.get_piano_roll(fs)[low:high] (velocities of
+    overlapping notes add up, drum notes are not rendered), except that sustain
+    pedal is not applied.
+
+    Parameters:
+    notes (NoteTable): The notes.
+    fs (float): The frame rate in frames per second.
+    pitch_range (tuple): The lowest and one past the highest MIDI note to render.
+    num_frames (int): The number of frames, longer rolls are cut and shorter
+    ones zero-padded (default: up to the end of the last note).
+    dtype (np.dtype): The output type.
+    sparse (bool): Return a scipy.sparse CSR matrix, never allocating the dense roll.
+
+    Returns:
+    np.ndarray: The (high - low) x num_frames piano roll.
+    """
+    low, high = pitch_range
+    start, end, num_frames = _frames(notes, fs, num_frames)
+    selected = (notes.pitch >= low) & (notes.pitch < high) & ~notes.is_drum
+
+    return _render(
+        notes.pitch[selected].astype(np.int64) - low,
+        start[selected],
+        end[selected],
+        notes.velocity[selected].astype(dtype),
+        high - low,
+        num_frames,
+        dtype,
+        sparse,
+    )
+
+
+def chroma_from_notes(
+    notes: NoteTable,
+    fs: float = 100,
+    num_frames=None,
+    dtype=np.float32,
+    sparse: bool = False,
+):
+    """
+    Render a chromagram straight from note arrays.
+
+    Same values as PrettyMIDI.get_chroma(fs) (drum notes are not rendered),
+    except that sustain pedal is not applied, without building the 128-row
+    piano roll first.
+
+    Parameters:
+    notes (NoteTable): The notes.
+    fs (float): The frame rate in frames per second.
+    num_frames (int): The number of frames (default: up to the end of the last note).
+    dtype (np.dtype): The output type.
+    sparse (bool): Return a scipy.sparse CSR matrix.
+
+    Returns:
+    np.ndarray: The 12 x num_frames chromagram.
+    """
+    start, end, num_frames = _frames(notes, fs, num_frames)
+    selected = ~notes.is_drum
+
+    return _render(
+        notes.pitch[selected].astype(np.int64) % 12,
+        start[selected],
+        end[selected],
+        notes.velocity[selected].astype(dtype),
+        12,
+        num_frames,
+        dtype,
+        sparse,
+    )
+
+
+###############################  segmentation  ################################
+SPLIT_POLICIES = ("clip", "carry", "duplicate")
+
+
+class Segmentation:
+    """
+    Notes of a file split at boundary times, without copying notes.
+
+    Segment i spans boundaries[i] to boundaries[i + 1] (the last one is open
+    ended). Notes are sorted by onset once, so the notes starting in a segment
+    are one slice of the shared arrays, found with np.searchsorted in
+    O(b log n). Notes starting before the first boundary are dropped.
+
+    Notes that sound past the end of their segment are handled by the policy:
+    - "clip": kept in the segment they start in, cut at its end.
+    - "carry": kept in the segment they start in, with their full length.
+    - "duplicate": repeated in every segment they overlap, cut to each.
+
+    Parameters:
+    notes (NoteTable): The notes of the file.
+    boundaries (np.ndarray): The segment start times in seconds.
+    policy (str): One of SPLIT_POLICIES.
+    """
+
+    def __init__(self, notes: NoteTable, boundaries, policy: str = "clip"):
+        if policy not in SPLIT_POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {SPLIT_POLICIES}.")
+        self.notes = notes.sorted()
+        self.boundaries = np.sort(np.asarray(boundaries, dtype=np.float64))
+        self.policy = policy
+        # segment i holds the notes self.offsets[i]:self.offsets[i + 1]
+        self.offsets = np.append(
+            np.searchsorted(self.notes.start, self.boundaries, side="left"),
+            len(self.notes),
+        )
+        self._max_length = (
+            float(np.max(self.notes.end - self.notes.start)) if len(self.notes) else 0.0
+        )
+
+    def __len__(self) -> int:
+        return len(self.boundaries)
+
+    def span(self, i: int) -> Tuple[float, float]:
+        """Start and end time of segment i (the end of the last segment is inf)."""
+        end = self.boundaries[i + 1] if i + 1 < len(self) else np.inf
+        return float(self.boundaries[i]), float(end)
+
+    def segment(self, i: int) -> NoteTable:
+        """
+        Parameters:
+        i (int): The segment index.
+
+        Returns:
+        NoteTable: The notes of segment i, in absolute time. Start, pitch,
+        velocity and instrument are views into the shared arrays, except with
+        the "duplicate" policy when notes from earlier segments sound into it.
+        """
+        seg_start, seg_end = self.span(i)
+        notes = self.notes[self.offsets[i] : self.offsets[i + 1]]
+
+        if self.policy == "duplicate":
+            # only notes starting less than the longest note length before can overlap
+            first = np.searchsorted(
+                self.notes.start, seg_start - self._max_length, side="left"
+            )
+            before = self.notes[first : self.offsets[i]]
+            sounding = before[before.end > seg_start]
+            if len(sounding):
+                notes = NoteTable(
+                    np.concatenate((np.full(len(sounding), seg_start), notes.start)),
+                    np.concatenate((sounding.end, notes.end)),
+                    np.concatenate((sounding.pitch, notes.pitch)),
+                    np.concatenate((sounding.velocity, notes.velocity)),
+                    np.concatenate((sounding.instrument, notes.instrument)),
+                    np.concatenate((sounding.is_drum, notes.is_drum)),
+                )
+
+        if self.policy != "carry":
+            notes = NoteTable(
+                notes.start,
+                np.minimum(notes.end, seg_end),
+                notes.pitch,
+                notes.velocity,
+                notes.instrument,
+                notes.is_drum,
+            )
+
+        return notes
+
+    def to_midi(self, i: int, instruments=None) -> pretty_midi.PrettyMIDI:
+        """
+        Build the MIDI file of a segment, with times relative to its start.
+
+        Parameters:
+        i (int): The segment index.
+        instruments (list): The source pretty_midi.Instrument objects, to copy
+        their program, drum flag and name (default: one piano per instrument index).
+
+        Returns:
+        PrettyMIDI: The segment.
+        """
+        seg_start, _ = self.span(i)
+        notes = self.segment(i)
+        midi = pretty_midi.PrettyMIDI()
+        for j in np.unique(notes.instrument):
+            source = instruments[j] if instruments is not None else None
+            instrument = pretty_midi.Instrument(
+                program=source.program if source is not None else 0,
+                is_drum=source.is_drum if source is not None else False,
+                name=source.name if source is not None else "",
+            )
+            selected = notes[notes.instrument == j]
+            instrument.notes = [
+                pretty_midi.Note(int(v), int(p), float(s - seg_start), float(e - seg_start))
+                for s, e, p, v in zip(
+                    selected.start, selected.end, selected.pitch, selected.velocity
+                )
+            ]
+            midi.instruments.append(instrument)
+
+        return midi
+
+    def write(self, i: int, path: str, instruments=None):
+        """Write segment i to a MIDI file, see to_midi."""
+        self.to_midi(i, instruments).write(path)
+
+
+#################################  metrics  ###################################
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# semitones above the root of each scale
+SCALE_INTERVALS = {
+    "major": (0, 2, 4, 5, 7, 9, 11),
+    "minor": (0, 2, 3, 5, 7, 8, 10),
+    "harmonic minor": (0, 2, 3, 5, 7, 8, 11),
+    "melodic minor": (0, 2, 3, 5, 7, 9, 11),
+    "dorian": (0, 2, 3, 5, 7, 9, 10),
+    "phrygian": (0, 1, 3, 5, 7, 8, 10),
+    "lydian": (0, 2, 4, 6, 7, 9, 11),
+    "mixolydian": (0, 2, 4, 5, 7, 9, 10),
+    "locrian": (0, 1, 3, 5, 6, 8, 10),
+}
+
+# 12-bit pitch class mask of every key (bit i set <=> PITCH_CLASSES[i] in the scale)
+KEY_NAMES = [
+    f"{PITCH_CLASSES[root]} {scale}" for scale in SCALE_INTERVALS for root in range(12)
+]
+KEY_MASKS = np.array(
+    [
+        sum(1 << ((root + interval) % 12) for interval in intervals)
+        for intervals in SCALE_INTERVALS.values()
+        for root in range(12)
+    ],
+    dtype=np.int64,
+)
+
+
+def pitch_class_mask(pitch: np.ndarray) -> int:
+    """
+    Reduce a set of notes to the pitch classes it uses.
+
+    Parameters:
+    pitch (np.ndarray): MIDI note numbers.
+
+    Returns:
+    int: A 12-bit mask, bit i is set if PITCH_CLASSES[i] is played.
+    """
+    present = np.bincount(np.asarray(pitch, dtype=np.int64) % 12, minlength=12) > 0
+    return int(np.dot(present, 1 << np.arange(12)))
+
+
+def estimate_keys(mask: int) -> list[str]:
+    """
+    List the keys whose scale contains every pitch class of a mask.
+
+    Parameters:
+    mask (int): A 12-bit pitch class mask, see pitch_class_mask.
+
+    Returns:
+    list: The matching names from KEY_NAMES, e.g. "C major", "A minor", "D dorian".
+    All keys match an empty mask.
+    """
+    fits = (KEY_MASKS & ~mask) == 0
+    return [KEY_NAMES[i] for i in np.flatnonzero(fits)]
+
+
+################################  all in one  #################################
+# TODO add manually-calculated "valid tempo range"
+
+def all_metrics(midi: pretty_midi.PrettyMIDI, config) -> Dict:
+    notes = NoteTable.from_midi(midi)
+    end_time = midi.get_end_time()
+    num_bins = int(math.ceil(end_time / config["bin_length"]))
+    total_velocities = notes.bin_sums(config["bin_length"], num_bins, notes.velocity)
+    counts = notes.bin_sums(config["bin_length"], num_bins)
+    average_length = notes.average_length()
+    played = counts > 0
+
+    metrics = {
+        "pitch_histogram": list(midi.get_pitch_class_histogram(use_duration=config["ph_weight_dur"], use_velocity=config["ph_weight_vel"])),
+        "tempo": midi.estimate_tempo(),
+        "file_len": end_time,
+        "note_count": len(notes),
+        "velocities": [
+            {"total_velocity": int(v), "count": int(c)}
+            for v, c in zip(total_velocities, counts)
+        ],
+        "lengths": average_length,
+        # metrics that are calculated from other metrics
+        "energies": (
+            config["w1"] * (total_velocities[played] / counts[played])
+            + config["w2"] * average_length
+        ).tolist(),
+        "simultaneous_counts": counts.tolist(),
+        "key": estimate_keys(pitch_class_mask(notes.pitch)),
+        # "unique_notes": set() # removed, modify to be able to write to JSON
+    }
+
+    return metrics
+
+
+############################  individual functions  ###########################
+
+
+def average_note_length(midi: pretty_midi.PrettyMIDI) -> float:
+    """
+    Calculate the average length of notes in a MIDI file.
+
+    Parameters:
+    midi (PrettyMIDI): The prettyMIDI container object for the MIDI file.
+
+    Returns:
+    float: The average length of notes in the MIDI file in seconds. If the file
+    has no notes, it returns 0.
+    """
+    return NoteTable.from_midi(midi).average_length()
+
+
+def total_number_of_notes(midi: pretty_midi.PrettyMIDI) -> int:
+    """
+    Calculate the total number of notes in a MIDI file.
+
+    Parameters:
+    midi (PrettyMIDI): The prettyMIDI container object for the MIDI file.
+
+    Returns:
+    int: The total number of notes in the MIDI file.
+    """
+
+    return sum(len(instrument.notes) for instrument in midi.instruments)
+
+
+def total_velocity(
+    midi: pretty_midi.PrettyMIDI, bin_length=None
+) -> list[dict[str, int]]:
+    """
+    Calculate the total velocity of all notes for each time bin in a MIDI file.
+
+    Parameters:
+    midi (PrettyMIDI): The prettyMIDI container object for the MIDI file.
+    bin_length (float): The length of time each bin should occupy. (default 1s)
+
+    Returns:
+    list: A list whose values are the total velocity and number of notes in that bin.
+    """
+    if bin_length == None:
+        bin_length = midi.get_end_time()
+    num_bins = int(math.ceil(midi.get_end_time() / bin_length))
+    notes = NoteTable.from_midi(midi)
+    total_velocities = notes.bin_sums(bin_length, num_bins, notes.velocity)
+    counts = notes.bin_sums(bin_length, num_bins)
+
+    return [
+        {"total_velocity": int(v), "count": int(c)}
+        for v, c in zip(total_velocities, counts)
+    ]
+
+
+def simultaneous_notes(midi: pretty_midi.PrettyMIDI, bin_length=None) -> list[int]:
+    """
+    Calculate the number of simultaneous notes being played each second in a MIDI file.
+
+    Parameters:
+    midi (PrettyMIDI): The prettyMIDI container object for the MIDI file.
+    bin_length (float): The length of time each bin should occupy. (default 1s)
+
+    Returns:
+    list: A list whose values are the number of simultaneous notes being played in that second.
+    """
+    if bin_length == None:
+        bin_length = midi.get_end_time()
+    num_bins = int(math.ceil(midi.get_end_time() / bin_length))
+
+    return NoteTable.from_midi(midi).bin_sums(bin_length, num_bins).tolist()
+
+
+def energy(
+    midi: pretty_midi.PrettyMIDI,
+    w1: float = 0.5,
+    w2: float = 0.5,
+    bin_length=None,
+) -> list[float]:
+    """
+    Calculate the number of simultaneous notes being played each second in a MIDI file.
+
+    Parameters:
+    midi (PrettyMIDI): The prettyMIDI container object for the MIDI file.
+    bin_length (float): The length of time each bin should occupy. (default is clip length)
+
+    Returns:
+    list: A list whose values are the number of simultaneous notes being played in that second.
+    """
+    if bin_length == None:
+        bin_length = midi.get_end_time()
+    num_bins = int(math.ceil(midi.get_end_time() / bin_length))
+    notes = NoteTable.from_midi(midi)
+    total_velocities = notes.bin_sums(bin_length, num_bins, notes.velocity)
+    counts = notes.bin_sums(bin_length, num_bins)
+
+    # each note in a bin adds w1 * (average velocity in the bin) + w2 * (average note length)
+    return (w1 * total_velocities + w2 * notes.average_length() * counts).tolist()
+
+
+def norm(data):
+    return (data - np.min(data)) / (np.max(data) - np.min(data))
+
+
+#################################  random  ###################################
+def quantize_midi(filename, sections_per_beat):
+    """
+    Quantizes a MIDI file into sections_per_beat sections per beat.
+
+    Args:
+    midi_file_path (str): Path to the MIDI file.
+    sections_per_beat (int): Number of quantization sections per beat.
+
+    Returns:
+    pretty_midi.PrettyMIDI: A quantized PrettyMIDI object.
+    """
+    midi_data = pretty_midi.PrettyMIDI(filename)
+    bpm = int(filename.split('-')[1])
+    section_duration = 60.0 / bpm / sections_per_beat
+
+    for instrument in midi_data.instruments:
+        for note in instrument.notes:
+            note.start = round(note.start / section_duration) * section_duration
+            note.end = round(note.end / section_duration) * section_duration
+
+    return midi_data
+
+
+def trim_piano_roll(piano_roll, min=None, max=None):
+    """
+    Trims the piano roll by removing rows above the highest note and below the
+    lowest note.
+
+    Args:
+    piano_roll (np.array): A 2D NumPy array representing the piano roll.
+    min (int): The note to remove everything below. If none is provided, the 
+    lowest note in the roll will be used
+    max (int): The note to remove everything above. If none is provided, the 
+    highest note in the roll will be used
+
+    Returns:
+    np.array: The trimmed piano roll.
+    """
+    non_zero_rows = np.where(np.any(piano_roll > 0, axis=1))[0]
+
+    if non_zero_rows.size == 0:
+        return piano_roll
+
+    lowest_note = non_zero_rows.min() if min is None else min
+    highest_note = non_zero_rows.max() if max is None else max
+
+    trimmed_piano_roll = piano_roll[lowest_note:highest_note+1, :]
+
+    return trimmed_piano_roll
\ No newline at end of file
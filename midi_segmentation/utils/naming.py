@@ -0,0 +1,50 @@
+"""
+Segment file names written by the segmentation notebooks and midi_segmentation.
+
+Kept free of heavy imports, so the similarity index, the player and the
+feature store can parse names without loading pretty_midi or matplotlib.
+"""
+import re
+from pathlib import Path
+
+from typing import Tuple
+
+
+def ssm_segment_name(parent: str, index: int, sr: float) -> str:
+    """
+    File name of a segment of the SSM segmentation.
+
+    Parameters:
+    parent (str): The parent sequence.
+    index (int): The index of the segment within its parent.
+    sr (float): The chroma frame rate, written in decimal (2 -> "sr2", 2.5 -> "sr2.5").
+
+    Returns:
+    str: The segment file name, parsed back by parse_segment_name.
+    """
+    sr_text = f"{sr:f}".rstrip("0").rstrip(".")
+    return f"{parent}-{index}-sr{sr_text}.mid"
+
+
+def parse_segment_name(filename: str) -> Tuple[str, float]:
+    """
+    Get the parent sequence and the position of a segment from its file name.
+
+    The segmentation notebooks write "{parent}_{start}-{end}.mid" (time and beat
+    segmentation) or "{parent}-{index}-sr{sr}.mid" (SSM segmentation, see
+    ssm_segment_name). Any other name is its own parent.
+
+    Parameters:
+    filename (str): The segment file name.
+
+    Returns:
+    tuple: The parent name and a sort key for the segment within its parent.
+    """
+    stem = Path(filename).stem
+    match = re.fullmatch(r"(.+)-(\d+)-sr\d+(?:\.\d+)?", stem)
+    if match:
+        return match.group(1), float(match.group(2))
+    match = re.fullmatch(r"(.+)_(\d+(?:\.\d+)?)-\d+(?:\.\d+)?", stem)
+    if match:
+        return match.group(1), float(match.group(2))
+    return stem, 0.0
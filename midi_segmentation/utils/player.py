@@ -0,0 +1,312 @@
+"""
+Gapless playback of a sequence of MIDI segments.
+
+A loader thread picks and parses the next segment while the current one plays,
+and a timing thread sends the messages of every segment on one continuous
+timeline, using the monotonic clock (sleep, then spin for the last
+millisecond). Lateness of every message and drift at the end of every segment
+are recorded.
+
+Usage (from the repository root):
+python -m midi_segmentation.utils.player "data/trimmed outputs" --index data/outputs/similarity.npz \
+    --port Disklavier --duration 600
+"""
+import argparse
+import os
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+
+import mido
+import numpy as np
+
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class Segment:
+    """The messages of a MIDI file, with their times in seconds from its start."""
+
+    name: str
+    times: np.ndarray
+    messages: List[mido.Message]
+    length: float
+
+
+def load_segment(path: str, name: Optional[str] = None) -> Segment:
+    """
+    Parse a MIDI file into absolute-time messages (meta messages are dropped).
+
+    Parameters:
+    path (str): Path to the MIDI file.
+    name (str): The segment name (default: the file name).
+
+    Returns:
+    Segment: The parsed segment.
+    """
+    midi_file = mido.MidiFile(path)
+    times = []
+    messages = []
+    t = 0.0
+    # iterating a MidiFile merges the tracks and gives delta times in seconds
+    for msg in midi_file:
+        t += msg.time
+        if not msg.is_meta:
+            times.append(t)
+            messages.append(msg)
+
+    return Segment(
+        name or os.path.basename(path),
+        np.array(times, dtype=np.float64),
+        messages,
+        midi_file.length,
+    )
+
+
+class MemorySink:
+    """Output port that records messages with their send time, for tests."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg: mido.Message):
+        self.sent.append((time.monotonic(), msg))
+
+    def reset(self):
+        pass
+
+
+@dataclass
+class TimingStats:
+    """Lateness of every sent message and drift at the end of every segment."""
+
+    lateness: List[float] = field(default_factory=list)
+    drift: List[float] = field(default_factory=list)
+    underruns: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns:
+        dict: Jitter (lateness) and drift statistics in milliseconds, and the
+        number of segments that were not ready in time.
+        """
+        lateness = np.array(self.lateness) * 1000
+        drift = np.array(self.drift) * 1000
+        return {
+            "messages": len(lateness),
+            "jitter_mean_ms": float(np.mean(np.abs(lateness))) if len(lateness) else 0.0,
+            "jitter_p99_ms": float(np.percentile(lateness, 99)) if len(lateness) else 0.0,
+            "jitter_max_ms": float(np.max(lateness)) if len(lateness) else 0.0,
+            "drift_max_ms": float(np.max(np.abs(drift))) if len(drift) else 0.0,
+            "underruns": self.underruns,
+        }
+
+
+def set_realtime_priority():
+    """Raise the priority of the calling thread when the OS allows it (Linux)."""
+    try:
+        priority = os.sched_get_priority_min(os.SCHED_FIFO)
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        return
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.nice(-10)
+    except (AttributeError, OSError):
+        pass
+
+
+class Player:
+    """
+    Play segments back to back on a MIDI output, preparing the next one while
+    the current one plays.
+
+    Parameters:
+    port: A mido output port, or anything with a send(msg) method (see MemorySink).
+    load (callable): Turns a segment name into a Segment.
+    choose_next (callable): Gives the name of the segment to play after the given
+    one, or None to stop.
+    preroll (float): Delay before the first message, in seconds.
+    spin (float): How long before each message the timing thread stops sleeping
+    and busy-waits, in seconds.
+    """
+
+    def __init__(
+        self,
+        port,
+        load: Callable[[str], Segment],
+        choose_next: Callable[[str], Optional[str]],
+        preroll: float = 0.1,
+        spin: float = 0.001,
+    ):
+        self.port = port
+        self.load = load
+        self.choose_next = choose_next
+        self.preroll = preroll
+        self.spin = spin
+        self.stats = TimingStats()
+        self.played = []
+        # one segment of lookahead: the loader blocks until the current one starts
+        self._ready = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+        self._error = None
+
+    def play(self, first: str, duration: float = float("inf")):
+        """
+        Play from the given segment until duration seconds are scheduled, there
+        is no next segment, or stop() is called. Blocks until playback ends.
+
+        Parameters:
+        first (str): The name of the first segment.
+        duration (float): The maximum playback time in seconds.
+
+        Raises:
+        Exception: Whatever load or choose_next raised; playback stops there.
+        """
+        self._stop.clear()
+        self._ready = queue.Queue(maxsize=1)
+        self._error = None
+        loader = threading.Thread(target=self._load_loop, args=(first,), daemon=True)
+        timer = threading.Thread(target=self._timing_loop, args=(duration,))
+        loader.start()
+        timer.start()
+        timer.join()
+        self._stop.set()
+        # the loader sets _error before it ends the stream, no need to join it
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._stop.set()
+
+    def _put(self, item: Optional[Segment]) -> bool:
+        """Queue an item for the timing thread, give up if playback stops."""
+        while not self._stop.is_set():
+            try:
+                self._ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self) -> Optional[Segment]:
+        """The next segment, or None at the end or if playback stops."""
+        while not self._stop.is_set():
+            try:
+                return self._ready.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _load_loop(self, name: Optional[str]):
+        try:
+            while name is not None and not self._stop.is_set():
+                if not self._put(self.load(name)):
+                    break
+                name = self.choose_next(name)
+        except Exception as e:  # re-raised in play()
+            self._error = e
+        finally:
+            # always end the stream, otherwise the timing thread waits forever
+            self._put(None)
+
+    def _wait_until(self, target: float):
+        remaining = target - time.monotonic()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.monotonic() < target:
+            pass
+
+    def _timing_loop(self, duration: float):
+        set_realtime_priority()
+        segment = self._get()
+        origin = start = time.monotonic() + self.preroll
+        while segment is not None and not self._stop.is_set():
+            now = time.monotonic()
+            if now > start:
+                # the segment was not ready in time, there will be a gap
+                self.stats.underruns += 1
+                start = now
+
+            self.played.append(segment.name)
+            for t, msg in zip(segment.times, segment.messages):
+                if self._stop.is_set():
+                    break
+                target = start + t
+                self._wait_until(target)
+                self.port.send(msg)
+                self.stats.lateness.append(time.monotonic() - target)
+
+            if self._stop.is_set():
+                break
+            end = start + segment.length
+            self._wait_until(end)
+            self.stats.drift.append(time.monotonic() - end)
+            start = end
+            if start - origin >= duration:
+                break
+            segment = self._get()
+
+        if hasattr(self.port, "reset"):
+            self.port.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play MIDI segments back to back, most similar segment next"
+    )
+    parser.add_argument("folder", help="folder of MIDI segments")
+    parser.add_argument(
+        "--index",
+        required=True,
+        help="similarity index (python -m midi_segmentation.utils.similarity)",
+    )
+    parser.add_argument("--port", help="MIDI output name (default: record in memory)")
+    parser.add_argument(
+        "--virtual", action="store_true", help="open --port as a virtual port"
+    )
+    parser.add_argument("--first", help="first segment (default: random)")
+    parser.add_argument(
+        "--duration", type=float, default=600, help="playback time in seconds"
+    )
+    parser.add_argument("--loop_chance", type=float, default=0.0)
+    args = parser.parse_args()
+
+    from .similarity import SimilarityIndex
+
+    index = SimilarityIndex.load(args.index)
+
+    def choose_next(name: str) -> Optional[str]:
+        index.mark_played(name)
+        if random.random() < args.loop_chance:
+            return name
+        next_name, similarity = index.most_similar(name)
+        print(f"next up is {next_name} (sim = {similarity:.3f})")
+        return next_name
+
+    if args.port:
+        port = mido.open_output(args.port, virtual=args.virtual)  # type: ignore
+    else:
+        port = MemorySink()
+
+    player = Player(
+        port,
+        lambda name: load_segment(os.path.join(args.folder, name), name),
+        choose_next,
+    )
+    try:
+        player.play(args.first or random.choice(index.names), args.duration)
+    except KeyboardInterrupt:
+        player.stop()
+    finally:
+        if args.port:
+            port.close()
+
+    for key, value in player.stats.summary().items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
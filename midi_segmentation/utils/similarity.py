@@ -0,0 +1,314 @@
+"""
+Cosine similarity between MIDI segments, computed with blocked matrix products.
+
+The all_metrics output of every segment is stacked into one float32 matrix with
+unit-norm rows, so cosine similarity is a dot product. Memory is bounded by
+block_size x n instead of n x n, unless the full table is asked for.
+
+    names, X = feature_matrix({name: m["metrics"] for name, m in midi_metrics.items()})
+    neighbours, sims = top_k(X, 10)
+    table = pd.DataFrame(similarity_table(X), index=names, columns=names)
+
+SimilarityIndex keeps the nearest neighbours of every segment on disk for the
+player. Build it from a utils.corpus index or a midi_metrics.json file with:
+python -m midi_segmentation.utils.similarity data/outputs/midi_metrics.json -o data/outputs/similarity.npz
+"""
+import argparse
+import json
+
+import numpy as np
+
+from .naming import parse_segment_name
+
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# scalar metrics that can be mixed with the pitch histogram, and how to read them
+# from an all_metrics output
+SCALAR_METRICS = {
+    "tempo": lambda m: m["tempo"],
+    "avg_note_len": lambda m: m["lengths"],
+    "num_notes": lambda m: m["note_count"],
+    "length": lambda m: m["file_len"],
+    "energy": lambda m: np.mean(m["energies"]) if m["energies"] else 0.0,
+}
+# same as build_similarity_table in play_similar.ipynb: pitch histogram only
+DEFAULT_WEIGHTS = {"pitch_histogram": 1.0}
+
+
+def feature_matrix(
+    metrics: Dict[str, Dict], weights: Optional[Dict[str, float]] = None
+) -> Tuple[list[str], np.ndarray]:
+    """
+    Stack segment metrics into a float32 matrix whose rows have unit norm.
+
+    The pitch histogram is normalized to sum to 1, scalar metrics (see
+    SCALAR_METRICS) are standardized across the corpus. Each group is then
+    multiplied by its weight. Rows that are all zero stay zero.
+
+    Parameters:
+    metrics (dict): The all_metrics output of each segment, keyed by name.
+    weights (dict): Weight of "pitch_histogram" and of each scalar metric to
+    include (default: pitch histogram only).
+
+    Returns:
+    tuple: The segment names and the n x d feature matrix, in the same order.
+    """
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    names = list(metrics)
+    columns = []
+
+    if weights.get("pitch_histogram", 0):
+        histograms = np.array(
+            [metrics[name]["pitch_histogram"] for name in names], dtype=np.float64
+        ).reshape(len(names), 12)
+        totals = histograms.sum(axis=1, keepdims=True)
+        histograms = np.divide(
+            histograms, totals, out=np.zeros_like(histograms), where=totals > 0
+        )
+        columns.append(weights["pitch_histogram"] * histograms)
+
+    for metric, weight in weights.items():
+        if metric == "pitch_histogram" or not weight:
+            continue
+        values = np.array(
+            [SCALAR_METRICS[metric](metrics[name]) for name in names], dtype=np.float64
+        )
+        std = values.std()
+        values = (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+        columns.append(weight * values[:, None])
+
+    X = np.hstack(columns) if columns else np.zeros((len(names), 0))
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    X = np.divide(X, norms, out=np.zeros_like(X), where=norms > 0)
+
+    return names, X.astype(np.float32)
+
+
+def iter_similarity_blocks(
+    X: np.ndarray, block_size: int = 4096
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Compute the cosine similarity table block of rows by block of rows.
+
+    Parameters:
+    X (np.ndarray): A feature matrix from feature_matrix.
+    block_size (int): The number of rows per block.
+
+    Yields:
+    tuple: The index of the first row of the block and its block_size x n similarities.
+    """
+    for start in range(0, len(X), block_size):
+        yield start, X[start : start + block_size] @ X.T
+
+
+def similarity_table(X: np.ndarray, block_size: int = 4096) -> np.ndarray:
+    """
+    Parameters:
+    X (np.ndarray): A feature matrix from feature_matrix.
+    block_size (int): The number of rows per block.
+
+    Returns:
+    np.ndarray: The full n x n float32 cosine similarity table.
+    """
+    table = np.empty((len(X), len(X)), dtype=np.float32)
+    for start, block in iter_similarity_blocks(X, block_size):
+        table[start : start + len(block)] = block
+    return table
+
+
+def top_k(
+    X: np.ndarray, k: int, block_size: int = 4096, exclude_self: bool = True
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k most similar segments of every segment without building the
+    full table.
+
+    Parameters:
+    X (np.ndarray): A feature matrix from feature_matrix.
+    k (int): The number of neighbours (capped to the number of candidates).
+    block_size (int): The number of rows per block.
+    exclude_self (bool): Do not count a segment as its own neighbour.
+
+    Returns:
+    tuple: The n x k neighbour indices and similarities, most similar first.
+    """
+    n = len(X)
+    k = max(0, min(k, n - int(exclude_self)))
+    indices = np.empty((n, k), dtype=np.int64)
+    sims = np.empty((n, k), dtype=np.float32)
+    if k == 0:
+        return indices, sims
+
+    for start, block in iter_similarity_blocks(X, block_size):
+        rows = np.arange(len(block))
+        if exclude_self:
+            block[rows, start + rows] = -np.inf
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        candidate_sims = block[rows[:, None], candidates]
+        order = np.argsort(-candidate_sims, axis=1, kind="stable")
+        indices[start : start + len(block)] = candidates[rows[:, None], order]
+        sims[start : start + len(block)] = candidate_sims[rows[:, None], order]
+
+    return indices, sims
+
+
+class SimilarityIndex:
+    """
+    Nearest neighbour index over segments, to pick the most similar segment to
+    play next.
+
+    The k nearest neighbours of every segment are precomputed, so a query only
+    scans a short sorted list for the first segment that is not excluded (already
+    played, or from the same parent). If all of them are excluded, the query
+    falls back to one matrix-vector product over the whole corpus.
+    """
+
+    def __init__(self, names, parents, X, neighbours, sims):
+        self.names = list(names)
+        self.parents = np.asarray(parents)
+        self.X = X
+        self.neighbours = neighbours
+        self.sims = sims
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.played = np.zeros(len(self.names), dtype=bool)
+
+    @classmethod
+    def build(
+        cls,
+        metrics: Dict[str, Dict],
+        parents: Optional[Dict[str, str]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        k: int = 64,
+        block_size: int = 4096,
+    ) -> "SimilarityIndex":
+        """
+        Parameters:
+        metrics (dict): The all_metrics output of each segment, keyed by name.
+        parents (dict): The parent sequence of each segment (default: parsed
+        from the file names, see utils.naming.parse_segment_name).
+        weights (dict): Feature weights, see feature_matrix.
+        k (int): The number of neighbours stored per segment.
+        block_size (int): The number of rows per block when searching neighbours.
+
+        Returns:
+        SimilarityIndex: The index.
+        """
+        names, X = feature_matrix(metrics, weights)
+        if parents is None:
+            parents = {name: parse_segment_name(name)[0] for name in names}
+        # parents are stored as integer codes, so that comparing them is cheap
+        _, parent_codes = np.unique([parents[name] for name in names], return_inverse=True)
+        neighbours, sims = top_k(X, k, block_size)
+
+        return cls(names, parent_codes, X, neighbours, sims)
+
+    def save(self, path: str):
+        """Write the index to a .npz file."""
+        np.savez(
+            path,
+            names=np.array(self.names),
+            parents=self.parents,
+            X=self.X,
+            neighbours=self.neighbours,
+            sims=self.sims,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "SimilarityIndex":
+        """Read an index written by save."""
+        with np.load(path) as data:
+            return cls(
+                data["names"].tolist(),
+                data["parents"],
+                data["X"],
+                data["neighbours"],
+                data["sims"],
+            )
+
+    def mark_played(self, name: str):
+        self.played[self.positions[name]] = True
+
+    def reset_plays(self):
+        self.played[:] = False
+
+    def most_similar(
+        self,
+        name: str,
+        different_parent: bool = True,
+        exclude: Iterable[str] = (),
+    ) -> Tuple[Optional[str], float]:
+        """
+        Find the most similar segment that has not been played yet.
+
+        Parameters:
+        name (str): The current segment.
+        different_parent (bool): Skip segments from the same parent sequence.
+        exclude (iterable): Other segment names to skip.
+
+        Returns:
+        tuple: The name of the next segment and its similarity, or None and
+        -inf if every segment is excluded.
+        """
+        i = self.positions[name]
+        excluded_others = np.array(
+            [self.positions[other] for other in exclude], dtype=np.int64
+        )
+
+        def allowed(candidates: np.ndarray) -> np.ndarray:
+            ok = ~self.played[candidates] & (candidates != i)
+            if different_parent:
+                ok &= self.parents[candidates] != self.parents[i]
+            if len(excluded_others):
+                ok &= ~np.isin(candidates, excluded_others)
+            return ok
+
+        # only the stored neighbours are checked, so this does not depend on the corpus size
+        ok = allowed(self.neighbours[i])
+        if ok.any():
+            j = np.argmax(ok)
+            return self.names[self.neighbours[i, j]], float(self.sims[i, j])
+
+        # every stored neighbour is excluded, search the whole corpus
+        sims = self.X @ self.X[i]
+        sims[~allowed(np.arange(len(self.names)))] = -np.inf
+        j = int(np.argmax(sims))
+        if np.isneginf(sims[j]):
+            return None, -np.inf
+        return self.names[j], float(sims[j])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the similarity index of a corpus of MIDI segments"
+    )
+    parser.add_argument(
+        "metrics", help="utils.corpus index file, or midi_metrics.json"
+    )
+    parser.add_argument("-o", "--output", default="similarity.npz")
+    parser.add_argument("-k", type=int, default=64, help="neighbours per segment")
+    parser.add_argument(
+        "-w",
+        "--weights",
+        help='JSON feature weights, e.g. \'{"pitch_histogram": 1, "energy": 0.5}\'',
+    )
+    args = parser.parse_args()
+
+    with open(args.metrics, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "entries" in data:  # utils.corpus index
+        metrics = {
+            name: entry["metrics"]
+            for name, entry in data["entries"].items()
+            if entry["metrics"] is not None
+        }
+    else:  # midi_metrics.json
+        metrics = {name: entry["metrics"] for name, entry in data.items()}
+
+    weights = json.loads(args.weights) if args.weights else None
+    index = SimilarityIndex.build(metrics, weights=weights, k=args.k)
+    index.save(args.output)
+    print(f"wrote the index of {len(index.names)} segments to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,22 +7,30 @@ setup(
     author='Geoffroy Peeters',
     url='https://github.com/geoffroypeeters/ssmnet_ISMIR2023',
     license='LGPL-3.0',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'tests']),
     include_package_data=True,
     package_data={
         'ssmnet': ['weights_deploy/*'],  # To include the .pth
     },
     install_requires=[
         'librosa==0.10.1',
+        'matplotlib==3.8.2',
+        'numba==0.58.1',
         'numpy==1.24.3',
+        'pretty_midi==0.2.10',
         'pyyaml==6.0',
         'scikit-learn==1.3.1',
         'scipy==1.10.1',
         'torch==2.1.0'
     ],
+    extras_require={
+        'export': ['onnx', 'onnxruntime'],  # ssmnet-export and the "onnx" backend
+    },
     entry_points={
         'console_scripts': [
             'ssmnet=ssmnet.example:ssmnet_main',  # For the command line, executes function pesto() in pesto/main as 'pesto'
+            'midi_segmentation=midi_segmentation.cli:main',
+            'ssmnet-export=ssmnet.export:ssmnet_export_main',
         ],
     }
 )
\ No newline at end of file
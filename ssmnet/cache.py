@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class FeatureCache:
+    """
+    On-disk cache of the time-reduced log-mel features (output of utils.f_reduce_time),
+    keyed by the content of the audio file and the "features" section of the
+    configuration. Files are evicted least-recently-used first when the cache is
+    larger than max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30):
+        """
+        Args:
+            cache_dir: folder holding the cached .npz files (created if needed)
+            max_bytes: maximum total size of the cache
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        return
+
+    def m_key(self, audio_file: str, config_features_d: dict) -> str:
+        """
+        Args:
+            audio_file
+            config_features_d: "features" section of the configuration file
+        Returns:
+            key: sha1 of the audio content followed by sha1 of the configuration
+        """
+        audio_hash = hashlib.sha1()
+        with open(audio_file, "rb") as fid:
+            for block in iter(lambda: fid.read(1 << 20), b""):
+                audio_hash.update(block)
+        config_hash = hashlib.sha1(
+            json.dumps(config_features_d, sort_keys=True).encode("utf-8")
+        )
+        return f"{audio_hash.hexdigest()}_{config_hash.hexdigest()[:16]}"
+
+    def m_get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Args:
+            key
+        Returns:
+            logmel_sync_m, time_sync_sec_v or None if not in the cache
+        """
+        file = os.path.join(self.cache_dir, f"{key}.npz")
+        try:
+            with np.load(file) as data:
+                value = data["logmel_sync_m"], data["time_sync_sec_v"]
+        except (OSError, KeyError, ValueError):
+            return None
+        # --- the modification time is the last access time used for eviction
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            # --- evicted by another process since it was read
+            pass
+        return value
+
+    def m_put(self, key: str, logmel_sync_m: np.ndarray, time_sync_sec_v: np.ndarray):
+        """
+        Store the features then evict old entries if the cache is too large
+
+        Args:
+            key
+            logmel_sync_m
+            time_sync_sec_v
+        """
+        file = os.path.join(self.cache_dir, f"{key}.npz")
+        # --- write to a temporary file of its own, so that a concurrent reader never sees
+        # --- half a file and concurrent writers of the same key do not share it
+        fd, tmp_file = tempfile.mkstemp(prefix=f"{key}.", suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as fid:
+                np.savez(fid, logmel_sync_m=logmel_sync_m, time_sync_sec_v=time_sync_sec_v)
+            os.replace(tmp_file, file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        self.m_evict()
+        return
+
+    def m_evict(self):
+        """
+        Remove the least recently used entries until the cache is at most max_bytes
+        """
+        entry_l = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".npz"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # --- evicted by another process since the scan
+                continue
+            entry_l.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entry_l)
+        for _, size, path in sorted(entry_l):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+        return
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import json
 import os
 import sys
-from typing import Tuple
+import time
+from typing import Optional, Tuple
 import warnings
 import numpy as np
 
@@ -17,20 +19,48 @@ import torch
 
 from . import utils
 from . import model
+from . import export
+from .cache import FeatureCache
+from .profiling import Profiler
 
 
 class SsmNetDeploy:
-    def __init__(self, config_d: dict):
+    def __init__(
+        self,
+        config_d: dict,
+        feature_cache: Optional[FeatureCache] = None,
+        backend: str = "eager",
+        export_file: Optional[str] = None,
+        quantize: bool = False,
+        profiler: Optional[Profiler] = None,
+    ):
         """
         Args:
             dictionary coming from configuration file
+            feature_cache: if given, the features are read from/written to this cache
+            backend: "eager" (the .pt weights), "torchscript" or "onnx" (a graph written
+                by ssmnet-export with the same configuration), see export.SsmNetRuntime
+            export_file: exported graph, for the "torchscript" and "onnx" backends
+            quantize: dynamic int8 quantization of the linear layers ("eager" backend)
+            profiler: times the stages of each method (default: disabled)
         """
         self.config_d = config_d
+        self.feature_cache = feature_cache
+        self.backend = backend
+        self.export_file = export_file
+        self.quantize = quantize
+        self.runtime = None
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        # --- time spent building/loading the model (0 when it comes from the cache)
+        self.model_load_sec = 0.0
+        # --- time spent in the last call to m_get_ssm_novelty (excluding model loading)
+        self.inference_sec = 0.0
         return
 
     def m_get_features(self, audio_file: str) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Compute the audio features
+        Compute the audio features (the time-reduced log-mel is read from the
+        feature cache when possible)
 
         Args:
             audio_file
@@ -38,75 +68,301 @@ class SsmNetDeploy:
             feat_3m,
             time_sec_v
         """
-        try:
-            audio_v, sr_hz = librosa.load(audio_file)
-        except:
-            sys.exit(f'something wrong in reading audio file "{audio_file}"')
+        logmel_sync_m, time_sync_sec_v = self.m_get_logmel_sync(audio_file)
+        return self.m_get_patches(logmel_sync_m, time_sync_sec_v)
 
-        if len(audio_v) == 0:
-            sys.exit(f'something wrong in reading audio file "{audio_file}"')
+    def m_get_logmel_sync(self, audio_file: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decode the audio and compute the time-reduced log-mel (first part of
+        m_get_features, small enough to be sent between processes)
 
-        logmel_m, time_sec_v = utils.f_extract_feature(audio_v, sr_hz)
-        logmel_sync_m, time_sync_sec_v = utils.f_reduce_time(
-            logmel_m, time_sec_v, self.config_d["features"]["step_target_sec"]
-        )
-        feat_3m, time_sec_v = utils.f_patches(
+        Args:
+            audio_file
+        Returns:
             logmel_sync_m,
-            time_sync_sec_v,
-            self.config_d["features"]["patch_halfduration_frame"],
-            self.config_d["features"]["patch_hop_frame"],
-        )
+            time_sync_sec_v
+        """
+        stage = self.profiler.m_stage
+        cache_key = None
+        cached = None
+        if self.feature_cache is not None and os.path.isfile(audio_file):
+            with stage("feature_cache_get"):
+                cache_key = self.feature_cache.m_key(audio_file, self.config_d["features"])
+                cached = self.feature_cache.m_get(cache_key)
+
+        if cached is not None:
+            logmel_sync_m, time_sync_sec_v = cached
+        else:
+            with stage("load", audio_file=audio_file):
+                try:
+                    audio_v, sr_hz = librosa.load(audio_file)
+                except:
+                    sys.exit(f'something wrong in reading audio file "{audio_file}"')
+
+            if len(audio_v) == 0:
+                sys.exit(f'something wrong in reading audio file "{audio_file}"')
+
+            with stage("extract_feature", duration_sec=len(audio_v) / sr_hz):
+                logmel_m, time_sec_v = utils.f_extract_feature(audio_v, sr_hz)
+            with stage("reduce_time"):
+                logmel_sync_m, time_sync_sec_v = utils.f_reduce_time(
+                    logmel_m, time_sec_v, self.config_d["features"]["step_target_sec"]
+                )
+            if cache_key is not None:
+                with stage("feature_cache_put"):
+                    self.feature_cache.m_put(cache_key, logmel_sync_m, time_sync_sec_v)
+
+        return logmel_sync_m, time_sync_sec_v
+
+    def m_get_patches(
+        self, logmel_sync_m: np.ndarray, time_sync_sec_v: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cut the time-reduced log-mel into patches (second part of m_get_features)
+
+        Args:
+            logmel_sync_m
+            time_sync_sec_v
+        Returns:
+            feat_3m,
+            time_sec_v
+        """
+        with self.profiler.m_stage("patches"):
+            feat_3m, time_sec_v = utils.f_patches(
+                logmel_sync_m,
+                time_sync_sec_v,
+                self.config_d["features"]["patch_halfduration_frame"],
+                self.config_d["features"]["patch_hop_frame"],
+            )
 
         self.step_sec = time_sec_v[1] - time_sec_v[0]
 
         return feat_3m, time_sec_v
 
-    def m_get_ssm_novelty(
-        self, feat_3m: np.ndarray, get_ssm: bool
-    ) -> Tuple[np.ndarray, np.ndarray]:
+    def m_get_model(self) -> model.SsmNet:
         """
-        Compute the Self-Similarity-Matrix and novelty-curve using a pre-trained SSM-Net
+        Get the pre-trained SSM-Net, loading it only once per process
 
         Args:
-            feat_3m
+
         Returns:
-            hat_ssm_np
-            hat_novelty_np
+            ssm_model
         """
-        # --- using torchlightning
-        # import ssm_lightning
-        # my_lighting = ssm_lightning.SsmLigthing.load_from_checkpoint(config_d['model']['file'])
-        # hat_novelty_v, hat_ssm_m = my_lighting.model.get_novelty( torch.from_numpy(feat_3m) )
-        # --- using ony torch
-        ssm_model = model.SsmNet(self.config_d["model"], self.step_sec)
         file_state_dict = os.path.join(
             os.path.dirname(__file__),
             "weights_deploy",
             self.config_d["model"]["file"].replace(".ckpt", "_state_dict.pt"),
         )
-        if (
-            False
-        ):  # --- load torchlightning -> need to convert, depends on the exact path of modules :-()
-            data = torch.load(
-                self.config_d["model"]["file"], map_location=torch.device("cpu")
+        with self.profiler.m_stage("model_load"):
+            ssm_model, self.model_load_sec = f_get_model(
+                self.config_d["model"], self.step_sec, file_state_dict
             )
-            data_clean = {}
-            for key in data["state_dict"].keys():
-                data_clean[key.replace("model.", "")] = data["state_dict"][key]
-            ssm_model.load_state_dict(data_clean)
-            # --- export to only state_dict -> this is the way to go
-            torch.save(ssm_model.state_dict(), file_state_dict)
+        return ssm_model
+
+    def m_get_runtime(self) -> export.SsmNetRuntime:
+        """
+        Get the runtime of the selected backend, created on first use
+
+        Args:
+
+        Returns:
+            runtime
+        """
+        if self.runtime is None:
+            start_time = time.perf_counter()
+            with self.profiler.m_stage("runtime_load", backend=self.backend):
+                self.runtime = export.SsmNetRuntime(
+                    self.backend,
+                    self.m_get_model() if self.backend == "eager" else None,
+                    self.export_file,
+                    self.quantize,
+                )
+            self.model_load_sec = time.perf_counter() - start_time
         else:
-            ssm_model.load_state_dict(torch.load(file_state_dict))
+            self.model_load_sec = 0.0
+        return self.runtime
 
-        hat_novelty_v, hat_ssm_m = ssm_model.get_novelty(
-            torch.from_numpy(feat_3m), get_ssm
-        )
-        hat_novelty_np = hat_novelty_v.detach().squeeze().numpy()
-        hat_ssm_np = hat_ssm_m.detach().squeeze().numpy()
+    def m_get_ssm_novelty(
+        self, feat_3m: np.ndarray, get_ssm: bool = True
+    ) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Compute the Self-Similarity-Matrix and novelty-curve using a pre-trained SSM-Net
+
+        Args:
+            feat_3m
+            get_ssm: if False, the dense SSM is not computed (the novelty only needs
+                its diagonals)
+        Returns:
+            hat_ssm_np (None if not get_ssm)
+            hat_novelty_np
+        """
+        stage = self.profiler.m_stage
+        if self.backend == "eager" and not self.quantize:
+            ssm_model = self.m_get_model()
+
+            start_time = time.perf_counter()
+            with torch.inference_mode():
+                hat_novelty_v, hat_ssm_m = ssm_model.get_novelty(
+                    torch.from_numpy(feat_3m).unsqueeze(0), get_ssm, stage
+                )
+            self.inference_sec = time.perf_counter() - start_time
+        else:
+            runtime = self.m_get_runtime()
+
+            start_time = time.perf_counter()
+            with stage("embedding_novelty", backend=self.backend, nb_patch=len(feat_3m)):
+                hat_novelty_v, embedding_m = runtime.m_run(torch.from_numpy(feat_3m))
+            hat_ssm_m = None
+            if get_ssm:
+                with stage("get_ssm"):
+                    hat_ssm_m = model.f_ssm_from_embedding(embedding_m)
+            self.inference_sec = time.perf_counter() - start_time
+
+        hat_novelty_np = hat_novelty_v.detach().numpy()
+        hat_ssm_np = None if hat_ssm_m is None else hat_ssm_m.detach().numpy()
 
         return hat_ssm_np, hat_novelty_np
 
+    def m_get_ssm_novelty_batch(
+        self, feat_3m_l: list, get_ssm: bool = True, max_batch_frame: int = 4096
+    ) -> Tuple[list, list]:
+        """
+        Compute the Self-Similarity-Matrix and novelty-curve of several tracks,
+        processing them through the pre-trained SSM-Net in padded batches.
+        Tracks are sorted by length so that a batch holds tracks of similar length,
+        a batch holds at most max_batch_frame patches (or a single longer track).
+        Padded batches need the eager float model: the other backends (and --quantize)
+        process the tracks one by one with m_get_ssm_novelty.
+
+        Args:
+            feat_3m_l: list of feat_3m (all computed with the same configuration)
+            get_ssm
+            max_batch_frame
+        Returns:
+            hat_ssm_np_l (None entries if not get_ssm)
+            hat_novelty_np_l
+        """
+        if self.backend != "eager" or self.quantize:
+            hat_ssm_np_l = []
+            hat_novelty_np_l = []
+            inference_sec = 0.0
+            for feat_3m in feat_3m_l:
+                hat_ssm_np, hat_novelty_np = self.m_get_ssm_novelty(feat_3m, get_ssm)
+                hat_ssm_np_l.append(hat_ssm_np)
+                hat_novelty_np_l.append(hat_novelty_np)
+                inference_sec += self.inference_sec
+            self.inference_sec = inference_sec
+            return hat_ssm_np_l, hat_novelty_np_l
+
+        ssm_model = self.m_get_model()
+
+        order_v = np.argsort([len(feat_3m) for feat_3m in feat_3m_l])
+        batch_l = []
+        for idx in order_v:
+            if (
+                not batch_l
+                or (len(batch_l[-1]) + 1) * len(feat_3m_l[idx]) > max_batch_frame
+            ):
+                batch_l.append([])
+            batch_l[-1].append(idx)
+
+        hat_ssm_np_l = [None] * len(feat_3m_l)
+        hat_novelty_np_l = [None] * len(feat_3m_l)
+        start_time = time.perf_counter()
+        with torch.inference_mode():
+            for batch in batch_l:
+                hat_novelty_v_l, hat_ssm_m_l = ssm_model.get_novelty_batch(
+                    [torch.from_numpy(feat_3m_l[idx]) for idx in batch], get_ssm
+                )
+                for idx, hat_novelty_v, hat_ssm_m in zip(
+                    batch, hat_novelty_v_l, hat_ssm_m_l
+                ):
+                    hat_novelty_np_l[idx] = hat_novelty_v.detach().numpy()
+                    if hat_ssm_m is not None:
+                        hat_ssm_np_l[idx] = hat_ssm_m.detach().numpy()
+        self.inference_sec = time.perf_counter() - start_time
+
+        return hat_ssm_np_l, hat_novelty_np_l
+
+    def m_get_novelty_streaming(
+        self,
+        audio_file: str,
+        chunk_patch: int = 1024,
+        context_patch: int = 128,
+        block_sec: float = 60.0,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the novelty-curve of a long audio file in O(T) memory:
+        - the audio is read block by block (see utils.f_extract_feature_stream)
+        - the embeddings are computed by chunks of chunk_patch patches, each chunk sees
+        context_patch extra patches on both sides in the attention layers
+        - only the diagonals of the SSM used by the novelty kernel are computed
+        (see model.f_ssm_band)
+        With another backend than eager (or --quantize), the embeddings of the chunks
+        come from the runtime (see m_get_runtime); the novelty head, applied once to
+        the whole band, is always the eager one (same weights).
+        Away from the chunk edges the result matches m_get_features + m_get_ssm_novelty
+        up to the attention context, which is limited to chunk_patch + 2*context_patch.
+
+        Args:
+            audio_file
+            chunk_patch
+            context_patch
+            block_sec
+        Returns:
+            hat_novelty_np
+            time_sec_v
+        """
+        patch_half = self.config_d["features"]["patch_halfduration_frame"]
+        patch_hop = self.config_d["features"]["patch_hop_frame"]
+
+        with self.profiler.m_stage("stream_features", audio_file=audio_file):
+            try:
+                logmel_sync_m, time_sync_sec_v = utils.f_extract_feature_stream(
+                    audio_file, self.config_d["features"]["step_target_sec"], block_sec
+                )
+            except Exception:
+                sys.exit(f'something wrong in reading audio file "{audio_file}"')
+
+        # --- the patches are a view of logmel_sync_m, they are copied chunk by chunk below
+        _, time_sec_v = utils.f_patches(logmel_sync_m, time_sync_sec_v, patch_half, patch_hop)
+        nb_patch = len(time_sec_v)
+        if nb_patch < 2:
+            sys.exit(f'audio file "{audio_file}" is too short')
+        self.step_sec = time_sec_v[1] - time_sec_v[0]
+
+        ssm_model = self.m_get_model()
+        runtime = None
+        if self.backend != "eager" or self.quantize:
+            runtime = self.m_get_runtime()
+
+        start_time = time.perf_counter()
+        embedding_l = []
+        with torch.inference_mode():
+            with self.profiler.m_stage("embedding", backend=self.backend, nb_patch=nb_patch):
+                for feat_3m, _, chunk_slice in utils.f_iter_patches(
+                    logmel_sync_m,
+                    time_sync_sec_v,
+                    patch_half,
+                    patch_hop,
+                    chunk_patch,
+                    context_patch,
+                ):
+                    if runtime is None:
+                        embedding_m = ssm_model.forward_batch([torch.from_numpy(feat_3m)])[0]
+                    else:
+                        _, embedding_m = runtime.m_run(torch.from_numpy(feat_3m))
+                    embedding_l.append(embedding_m[chunk_slice])
+
+            with self.profiler.m_stage("conv_novelty"):
+                hat_band_m = model.f_ssm_band(
+                    torch.cat(embedding_l), 2 * ssm_model.kernel_Ldemi
+                )
+                hat_novelty_v = ssm_model.get_novelty_from_band(hat_band_m)
+        self.inference_sec = time.perf_counter() - start_time
+
+        return hat_novelty_v.numpy(), time_sec_v
+
     def m_get_boundaries(
         self, hat_novelty_np: np.ndarray, time_sec_v: np.ndarray
     ) -> Tuple[np.ndarray, np.ndarray]:
@@ -120,23 +376,24 @@ class SsmNetDeploy:
             hat_boundary_sec_v,
             hat_boundary_frame_v
         """
-        hat_boundary_frame_v = utils.f_get_peaks(
-            hat_novelty_np, self.config_d["postprocessing"], self.step_sec
-        )
+        with self.profiler.m_stage("peaks"):
+            hat_boundary_frame_v = utils.f_get_peaks(
+                hat_novelty_np, self.config_d["postprocessing"], self.step_sec
+            )
 
-        hat_boundary_sec_v = time_sec_v[hat_boundary_frame_v]
-        # --- add start and end-time
-        hat_boundary_sec_v = np.concatenate(
-            (0 * np.ones(1), hat_boundary_sec_v, time_sec_v[-1] * np.ones(1))
-        )
-        # --- to be sure there is not twice zero
-        hat_boundary_sec_v = sorted([aaa for aaa in set(hat_boundary_sec_v)])
+            hat_boundary_sec_v = time_sec_v[hat_boundary_frame_v]
+            # --- add start and end-time
+            hat_boundary_sec_v = np.concatenate(
+                (0 * np.ones(1), hat_boundary_sec_v, time_sec_v[-1] * np.ones(1))
+            )
+            # --- to be sure there is not twice zero
+            hat_boundary_sec_v = sorted([aaa for aaa in set(hat_boundary_sec_v)])
 
         return hat_boundary_sec_v, hat_boundary_frame_v
 
     def m_plot(
         self,
-        hat_ssm_np: np.ndarray,
+        hat_ssm_np: Optional[np.ndarray],
         hat_novelty_np: np.ndarray,
         hat_boundary_frame_v: np.ndarray,
         output_file: str,
@@ -145,7 +402,7 @@ class SsmNetDeploy:
         Plot and save to pdf file
 
         Args:
-            hat_ssm_np
+            hat_ssm_np (if None, only the novelty-curve and boundaries are plotted)
             hat_novelty_np
             hat_boundary_frame_v
             output_file
@@ -158,16 +415,21 @@ class SsmNetDeploy:
             )
             return
 
-        plt.clf()
-        plt.imshow(hat_ssm_np)
-        plt.colorbar()
-        nb_frame = hat_ssm_np.shape[0]
-        plt.plot(
-            (1 - hat_novelty_np / max(hat_novelty_np)) * nb_frame, "r", linewidth=1
-        )
-        for x in hat_boundary_frame_v:
-            plt.plot([x, x], [nb_frame, 0], "m", linewidth=1)
-        plt.savefig(output_file)
+        with self.profiler.m_stage("plot", output_file=output_file):
+            plt.clf()
+            nb_frame = len(hat_novelty_np)
+            if hat_ssm_np is not None:
+                plt.imshow(hat_ssm_np)
+                plt.colorbar()
+            else:
+                plt.xlim(0, nb_frame)
+                plt.ylim(nb_frame, 0)
+            plt.plot(
+                (1 - hat_novelty_np / max(hat_novelty_np)) * nb_frame, "r", linewidth=1
+            )
+            for x in hat_boundary_frame_v:
+                plt.plot([x, x], [nb_frame, 0], "m", linewidth=1)
+            plt.savefig(output_file)
 
         return
 
@@ -181,14 +443,73 @@ class SsmNetDeploy:
         Returns:
 
         """
-        start = hat_boundary_sec_v[0:-1]
-        stop = hat_boundary_sec_v[1:]
-        label = np.ones(len(start))
-        data = np.stack((start, stop, label), axis=1)
-        header = "segment_start_time_sec,segment_stop_time_sec,segment_label"
+        with self.profiler.m_stage("export_csv"):
+            start = hat_boundary_sec_v[0:-1]
+            stop = hat_boundary_sec_v[1:]
+            label = np.ones(len(start))
+            data = np.stack((start, stop, label), axis=1)
+            header = "segment_start_time_sec,segment_stop_time_sec,segment_label"
 
-        np.savetxt(
-            output_file, data, delimiter=",", fmt="%.3f", header=header, comments=""
-        )
+            np.savetxt(
+                output_file, data, delimiter=",", fmt="%.3f", header=header, comments=""
+            )
 
         return
+
+
+# --- pre-trained models already loaded in this process, see f_get_model
+_MODEL_CACHE_D = {}
+
+
+def f_get_model(
+    config_model_d: dict, step_sec: float, file_state_dict: str
+) -> Tuple[model.SsmNet, float]:
+    """
+    Build a SSM-Net, load its weights and put it in inference mode.
+    The model is cached per process, keyed by the model configuration, step_sec and
+    weights file, so that processing many files only pays for it once.
+
+    Args:
+        config_model_d: "model" section of the configuration file
+        step_sec: time step of the patches (defines the novelty kernel size)
+        file_state_dict: fullpath to the state_dict .pt file
+    Returns:
+        ssm_model
+        load_time_sec: time spent building/loading the model (0 if already cached)
+    """
+    key = (
+        json.dumps(config_model_d, sort_keys=True),
+        round(float(step_sec), 6),
+        os.path.abspath(file_state_dict),
+        os.path.getmtime(file_state_dict),
+    )
+    if key in _MODEL_CACHE_D:
+        return _MODEL_CACHE_D[key], 0.0
+
+    start_time = time.perf_counter()
+    # --- using torchlightning
+    # import ssm_lightning
+    # my_lighting = ssm_lightning.SsmLigthing.load_from_checkpoint(config_d['model']['file'])
+    # hat_novelty_v, hat_ssm_m = my_lighting.model.get_novelty( torch.from_numpy(feat_3m) )
+    # --- using ony torch
+    ssm_model = model.SsmNet(config_model_d, step_sec)
+    if (
+        False
+    ):  # --- load torchlightning -> need to convert, depends on the exact path of modules :-()
+        data = torch.load(config_model_d["file"], map_location=torch.device("cpu"))
+        data_clean = {}
+        for name in data["state_dict"].keys():
+            data_clean[name.replace("model.", "")] = data["state_dict"][name]
+        ssm_model.load_state_dict(data_clean)
+        # --- export to only state_dict -> this is the way to go
+        torch.save(ssm_model.state_dict(), file_state_dict)
+    else:
+        ssm_model.load_state_dict(
+            torch.load(file_state_dict, map_location=torch.device("cpu"))
+        )
+    ssm_model.eval()
+    ssm_model.requires_grad_(False)
+    load_time_sec = time.perf_counter() - start_time
+
+    _MODEL_CACHE_D[key] = ssm_model
+    return ssm_model, load_time_sec
@@ -1,10 +1,259 @@
 # python -m ssmnet_example -c ./config_example.yaml -a /home/ids/gpeeters/M2-ATIAM-internship/music-structure-estimation/_references/rwc-pop/audio/RM-P001.wav
+# batch mode: ssmnet ./rwc-pop/audio -d ./rwc-pop/ssmnet -j 8
 
 from .parser import parse_args
 from .core import SsmNetDeploy
+from .cache import FeatureCache
+from .profiling import Profiler
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import glob
 import yaml
 import pdb
 import os
+import sys
+import time
+
+AUDIO_EXTENSION_L = [".wav", ".mp3", ".flac", ".ogg", ".aif", ".aiff", ".m4a"]
+MANIFEST_EXTENSION_L = [".txt", ".lst", ".m3u"]
+
+# --- SsmNetDeploy of each feature worker, see f_init_worker
+_WORKER_SSMNET_DEPLOY = None
+
+
+def f_get_audio_file_l(audio_input):
+    """
+    Args:
+        audio_input: audio file, directory (searched recursively), manifest (one audio file
+            per line, relative to the manifest folder, # for comments) or glob pattern
+    Returns:
+        audio_file_l
+        batch: False if audio_input is a single audio file
+    """
+    ext = os.path.splitext(audio_input)[1].lower()
+    if os.path.isdir(audio_input):
+        audio_file_l = sorted(
+            os.path.join(root, name)
+            for root, _, name_l in os.walk(audio_input)
+            for name in name_l
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSION_L
+        )
+    elif os.path.isfile(audio_input) and ext in MANIFEST_EXTENSION_L:
+        with open(audio_input, "r", encoding="utf-8") as fid:
+            line_l = [line.strip() for line in fid]
+        audio_file_l = [
+            os.path.join(os.path.dirname(audio_input), line)
+            for line in line_l
+            if line and not line.startswith("#")
+        ]
+    elif os.path.isfile(audio_input):
+        return [audio_input], False
+    else:
+        audio_file_l = sorted(
+            f for f in glob.glob(audio_input, recursive=True) if os.path.isfile(f)
+        )
+    return audio_file_l, True
+
+
+def f_init_worker(config_d, cache_dir, cache_max_bytes):
+    global _WORKER_SSMNET_DEPLOY
+    feature_cache = None
+    if cache_dir is not None:
+        feature_cache = FeatureCache(cache_dir, cache_max_bytes)
+    _WORKER_SSMNET_DEPLOY = SsmNetDeploy(config_d, feature_cache)
+
+
+def f_get_logmel_sync(audio_file, profile, profile_memory, origin_ns):
+    """
+    Args:
+        audio_file
+        profile, profile_memory: see Profiler (enabled, track_memory)
+        origin_ns: origin of the trace of the main process
+    Returns:
+        logmel_sync_m, time_sync_sec_v
+        event_l: stages of the worker, to merge in the trace of the track
+    """
+    profiler = Profiler(profile, profile_memory, origin_ns=origin_ns)
+    _WORKER_SSMNET_DEPLOY.profiler = profiler
+    logmel_sync_m, time_sync_sec_v = _WORKER_SSMNET_DEPLOY.m_get_logmel_sync(audio_file)
+    return logmel_sync_m, time_sync_sec_v, profiler.event_l
+
+
+def f_write_outputs(ssmnet_deploy, hat_ssm_np, hat_novelty_np, time_sec_v, output_csv_file, output_pdf_file):
+    """
+    Estimate the boundaries then write the pdf (if output_pdf_file is not None) and the csv
+    """
+    hat_boundary_sec_v, hat_boundary_frame_v = ssmnet_deploy.m_get_boundaries(hat_novelty_np, time_sec_v)
+    if output_pdf_file is not None:
+        ssmnet_deploy.m_plot(hat_ssm_np, hat_novelty_np, hat_boundary_frame_v, output_pdf_file)
+    ssmnet_deploy.m_export_csv(hat_boundary_sec_v, output_csv_file)
+
+
+def f_write_track(ssmnet_deploy, job, hat_ssm_np, hat_novelty_np, time_sec_v):
+    """
+    Write the outputs of a track of the batch mode. The csv marks the track as done: it is
+    written last, and on failure neither the csv nor the pdf is left.
+
+    Args:
+        job: audio_file, output_csv_file, output_pdf_file (None: no pdf)
+        hat_ssm_np, hat_novelty_np, time_sec_v: see f_write_outputs
+    """
+    _, output_csv_file, output_pdf_file = job
+    os.makedirs(os.path.dirname(output_csv_file) or ".", exist_ok=True)
+    tmp_csv_file = f"{output_csv_file}.tmp"
+    try:
+        f_write_outputs(ssmnet_deploy, hat_ssm_np, hat_novelty_np, time_sec_v, tmp_csv_file, output_pdf_file)
+        os.replace(tmp_csv_file, output_csv_file)
+    except BaseException:
+        for file in (tmp_csv_file, output_pdf_file):
+            if file is not None and os.path.exists(file):
+                os.remove(file)
+        raise
+
+
+def f_run_batch(ssmnet_deploy, args, config_d, audio_file_l):
+    """
+    Process many audio files in this (warm) process: a pool of workers decodes the audio
+    and computes the time-reduced log-mel while the model processes the tracks already
+    done, all the tracks ready at once (see SsmNetDeploy.m_get_ssm_novelty_batch).
+    Outputs keep the name of the audio file, relative to the common folder of all
+    files (song.wav -> song.wav.csv). The csv of a track is written last, tracks whose csv
+    exists are skipped.
+    With --profile, the stages of each track (including those of the workers and the
+    model call it shared with other tracks) are written next to its csv (.trace.json),
+    and those of all tracks to the --profile file.
+    """
+    root_dir = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in audio_file_l])
+    job_l = []
+    for audio_file in audio_file_l:
+        # --- keep the extension: song.wav and song.mp3 are different tracks
+        name = os.path.relpath(os.path.abspath(audio_file), root_dir)
+        output_csv_file = os.path.join(args.output_dir, f"{name}.csv")
+        output_pdf_file = None if args.no_pdf else os.path.join(args.output_dir, f"{name}.pdf")
+        if os.path.exists(output_csv_file) and not args.overwrite:
+            continue
+        job_l.append((audio_file, output_csv_file, output_pdf_file))
+    print(f'{len(audio_file_l)} audio files, {len(audio_file_l) - len(job_l)} already done, {len(job_l)} to process')
+
+    failed_l = []
+    nb_done = 0
+    start_time = time.perf_counter()
+    batch_profiler = ssmnet_deploy.profiler
+    # --- the dense SSM is only needed for the pdf
+    get_ssm = not args.no_pdf and not args.novelty_only
+
+    def f_new_profiler():
+        # --- one trace per track, on the time axis of the batch
+        return Profiler(batch_profiler.enabled, batch_profiler.track_memory, origin_ns=batch_profiler.origin_ns)
+
+    def f_end_track(job, profiler, error=None, shared_event_l=()):
+        nonlocal nb_done
+        audio_file, output_csv_file, _ = job
+        ssmnet_deploy.profiler = batch_profiler
+        if error is not None:
+            failed_l.append(audio_file)
+            print(f'\nfailed on "{audio_file}": {error}', file=sys.stderr)
+        if profiler.enabled:
+            batch_profiler.m_add_events(profiler.event_l)
+            profiler.m_add_events(shared_event_l)
+            os.makedirs(os.path.dirname(output_csv_file) or ".", exist_ok=True)
+            trace_file = f"{os.path.splitext(output_csv_file)[0]}.trace.json"
+            profiler.m_export_chrome_trace(trace_file, audio_file=audio_file, config_file=args.config_file)
+        nb_done += 1
+        print(f'\r[{nb_done}/{len(job_l)}] {nb_done / (time.perf_counter() - start_time):.2f} tracks/sec', end='', flush=True)
+
+    def f_run_streaming(job):
+        profiler = f_new_profiler()
+        ssmnet_deploy.profiler = profiler
+        try:
+            with profiler.m_stage("track", audio_file=job[0]):
+                hat_novelty_np, time_sec_v = ssmnet_deploy.m_get_novelty_streaming(job[0], args.chunk_patch, args.context_patch)
+                f_write_track(ssmnet_deploy, job, None, hat_novelty_np, time_sec_v)
+        except (Exception, SystemExit) as error:
+            f_end_track(job, profiler, error)
+            return
+        f_end_track(job, profiler)
+
+    def f_run_ready(ready_l):
+        """
+        ready_l: list of (job, future of f_get_logmel_sync), given to the model in one call
+        """
+        track_l = []
+        for job, future in ready_l:
+            profiler = f_new_profiler()
+            ssmnet_deploy.profiler = profiler
+            try:
+                logmel_sync_m, time_sync_sec_v, event_l = future.result()
+                profiler.m_add_events(event_l)
+                feat_3m, time_sec_v = ssmnet_deploy.m_get_patches(logmel_sync_m, time_sync_sec_v)
+            except (Exception, SystemExit) as error:
+                f_end_track(job, profiler, error)
+                continue
+            track_l.append((job, profiler, feat_3m, time_sec_v))
+        if not track_l:
+            return
+
+        model_profiler = f_new_profiler()
+        ssmnet_deploy.profiler = model_profiler
+        try:
+            with model_profiler.m_stage("ssm_novelty_batch", nb_track=len(track_l)):
+                hat_ssm_np_l, hat_novelty_np_l = ssmnet_deploy.m_get_ssm_novelty_batch(
+                    [feat_3m for _, _, feat_3m, _ in track_l], get_ssm
+                )
+        except (Exception, SystemExit) as error:
+            batch_profiler.m_add_events(model_profiler.event_l)
+            for job, profiler, _, _ in track_l:
+                f_end_track(job, profiler, error, model_profiler.event_l)
+            return
+        batch_profiler.m_add_events(model_profiler.event_l)
+
+        for (job, profiler, _, time_sec_v), hat_ssm_np, hat_novelty_np in zip(track_l, hat_ssm_np_l, hat_novelty_np_l):
+            ssmnet_deploy.profiler = profiler
+            try:
+                f_write_track(ssmnet_deploy, job, hat_ssm_np, hat_novelty_np, time_sec_v)
+            except (Exception, SystemExit) as error:
+                f_end_track(job, profiler, error, model_profiler.event_l)
+                continue
+            f_end_track(job, profiler, shared_event_l=model_profiler.event_l)
+
+    pending_l = list(reversed(job_l))
+    if args.chunk_patch > 0:
+        # --- long files: the audio is streamed by m_get_novelty_streaming, in this process
+        while pending_l:
+            f_run_streaming(pending_l.pop())
+    else:
+        workers = args.workers or os.cpu_count() or 1
+        running_d = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=f_init_worker,
+            initargs=(config_d, args.cache_dir, int(args.cache_max_mb * 2**20)),
+        ) as executor:
+            while pending_l or running_d:
+                # --- at most 2 tracks per worker wait for the model
+                while pending_l and len(running_d) < 2 * workers:
+                    job = pending_l.pop()
+                    running_d[executor.submit(
+                        f_get_logmel_sync, job[0], batch_profiler.enabled, batch_profiler.track_memory, batch_profiler.origin_ns
+                    )] = job
+                done_s, _ = wait(running_d, return_when=FIRST_COMPLETED)
+                f_run_ready([(running_d.pop(future), future) for future in done_s])
+    print()
+
+    if failed_l:
+        sys.exit(f'{len(failed_l)} tracks failed: {failed_l}')
+
+
+def f_print_profile(profiler, args):
+    """
+    Write the trace to args.profile and print the time spent in each stage
+    """
+    if args.profile is None:
+        return
+    profiler.m_export_chrome_trace(args.profile, audio_file=args.audio_file, config_file=args.config_file)
+    for name, stage_d in profiler.m_summary().items():
+        print(f'{name:>18}: {stage_d["sec"]:8.3f} sec ({stage_d["count"]}x)')
+    print(f'wrote "{args.profile}"')
+
 
 def ssmnet_main():
     """
@@ -16,14 +265,37 @@ def ssmnet_main():
     with open(args.config_file, "r", encoding="utf-8") as fid:
         config_d = yaml.safe_load(fid)
 
-    ssmnet_deploy = SsmNetDeploy(config_d)
-    feat_3m, time_sec_v = ssmnet_deploy.m_get_features(args.audio_file)
-    hat_ssm_np, hat_novelty_np = ssmnet_deploy.m_get_ssm_novelty(feat_3m)
-    hat_boundary_sec_v, hat_boundary_frame_v = ssmnet_deploy.m_get_boundaries(hat_novelty_np, time_sec_v)
-    ssmnet_deploy.m_plot(hat_ssm_np, hat_novelty_np, hat_boundary_frame_v, args.output_pdf_file)
-    ssmnet_deploy.m_export_csv(hat_boundary_sec_v, args.output_csv_file)
+    feature_cache = None
+    if args.cache_dir is not None:
+        feature_cache = FeatureCache(args.cache_dir, int(args.cache_max_mb * 2**20))
+    audio_file_l, batch = f_get_audio_file_l(args.audio_file)
+    if not audio_file_l:
+        sys.exit(f'no audio file found for "{args.audio_file}"')
+
+    profiler = Profiler(args.profile is not None, args.profile_memory, args.profile_torch)
+    ssmnet_deploy = SsmNetDeploy(config_d, feature_cache, args.backend, args.export_file, args.quantize, profiler)
+
+    if batch:
+        try:
+            f_run_batch(ssmnet_deploy, args, config_d, audio_file_l)
+        finally:
+            f_print_profile(profiler, args)
+        return
+
+    with profiler.m_stage("total", audio_file=args.audio_file):
+        if args.chunk_patch > 0:
+            # --- long files: no SSM is computed
+            hat_ssm_np = None
+            hat_novelty_np, time_sec_v = ssmnet_deploy.m_get_novelty_streaming(args.audio_file, args.chunk_patch, args.context_patch)
+        else:
+            feat_3m, time_sec_v = ssmnet_deploy.m_get_features(args.audio_file)
+            hat_ssm_np, hat_novelty_np = ssmnet_deploy.m_get_ssm_novelty(feat_3m, get_ssm=not args.novelty_only)
+        print(f'model loading: {ssmnet_deploy.model_load_sec:.3f} sec, inference: {ssmnet_deploy.inference_sec:.3f} sec')
+        f_write_outputs(ssmnet_deploy, hat_ssm_np, hat_novelty_np, time_sec_v, args.output_csv_file, args.output_pdf_file)
+
+    f_print_profile(profiler, args)
 
 
 
 if __name__ == "__main__":
-    ssmnet_main()
\ No newline at end of file
+    ssmnet_main()
@@ -0,0 +1,355 @@
+"""
+Export SSM-Net (embedding + novelty heads) to TorchScript and ONNX, then check the
+exported graphs against the eager model and measure their CPU latency.
+
+ssmnet-export -c config_example.yaml -o ./exported [-a audio.wav] [--quantize]
+
+The exported graphs take feat_3m (nb_patch, 80, 40) float32 and return
+hat_novelty_v (nb_patch,) and embedding_m (nb_patch, 128), the SSM is
+1 - cdist(embedding_m, embedding_m)**2 / 4 (see model.f_ssm_from_embedding).
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import importlib.util
+import json
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# --- onnxruntime is only imported by the "onnx" backend and the ONNX quantization
+ONNXRUNTIME_AVAILABLE = importlib.util.find_spec("onnxruntime") is not None
+
+from . import model
+
+BACKEND_L = ["eager", "torchscript", "onnx"]
+
+
+class SsmNetExport(nn.Module):
+    """SSM-Net embedding + novelty-curve (band path) as a single traceable module"""
+
+    def __init__(self, ssm_model: model.SsmNet):
+        """
+        Args:
+            ssm_model: a SsmNet in eval mode (it is copied, not modified)
+        """
+        super(SsmNetExport, self).__init__()
+        self.ssm_model = copy.deepcopy(ssm_model)
+        # --- a single conv batch, otherwise the number of batches is frozen in the trace
+        self.ssm_model.conv_batch = 2**31 - 1
+        self.width = 2 * self.ssm_model.kernel_Ldemi
+        # --- a constant of the graph (an initializer for the ONNX quantizer), instead of
+        # --- being gathered from conv_novelty.weight at each run
+        with torch.no_grad():
+            self.register_buffer(
+                "diagonal_weight_3m", self.ssm_model.m_get_diagonal_weight().clone()
+            )
+
+    def forward(self, feat_3m: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Args:
+            feat_3m (T, f=80, t=40)
+        Returns:
+            hat_novelty_v (T,)
+            embedding_m (T, dim_embed)
+        """
+        embedding_m = self.ssm_model(feat_3m.unsqueeze(0))
+        hat_novelty_v = self.ssm_model.get_novelty_from_band(
+            model.f_ssm_band(embedding_m, self.width), self.diagonal_weight_3m
+        )
+        return hat_novelty_v, embedding_m
+
+
+def f_quantize(ssm_model: nn.Module) -> nn.Module:
+    """
+    Dynamic int8 quantization of the linear layers (feed-forward of the attention layers);
+    the attention projections of nn.MultiheadAttention are not quantizable and stay in float32
+
+    Args:
+        ssm_model
+    Returns:
+        quantized copy of ssm_model
+    """
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(ssm_model), {nn.Linear}, dtype=torch.qint8
+    )
+
+
+def f_export_torchscript(
+    ssm_model: model.SsmNet, example_feat_3m: torch.Tensor, output_file: str
+) -> torch.jit.ScriptModule:
+    """
+    Trace SsmNetExport and save it
+
+    Args:
+        ssm_model
+        example_feat_3m (T, f=80, t=40): example input (T >= 2)
+        output_file: .pt file
+    Returns:
+        traced module
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(SsmNetExport(ssm_model).eval(), example_feat_3m)
+        traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, output_file)
+    return traced
+
+
+def f_export_onnx(
+    ssm_model: model.SsmNet,
+    example_feat_3m: torch.Tensor,
+    output_file: str,
+    quantize: bool = False,
+) -> str:
+    """
+    Export SsmNetExport to ONNX with a dynamic number of patches
+
+    Args:
+        ssm_model: float32 model (ONNX quantization is done by onnxruntime)
+        example_feat_3m (T, f=80, t=40): example input (T >= 2)
+        output_file: .onnx file
+        quantize: also write a dynamically quantized graph, and return its file
+    Returns:
+        file of the exported graph
+    """
+    with torch.no_grad():
+        torch.onnx.export(
+            SsmNetExport(ssm_model).eval(),
+            (example_feat_3m,),
+            output_file,
+            input_names=["feat_3m"],
+            output_names=["hat_novelty_v", "embedding_m"],
+            dynamic_axes={
+                "feat_3m": {0: "nb_patch"},
+                "hat_novelty_v": {0: "nb_patch"},
+                "embedding_m": {0: "nb_patch"},
+            },
+            opset_version=17,
+        )
+    if not quantize:
+        return output_file
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_file = output_file.replace(".onnx", "_int8.onnx")
+    # --- as f_quantize: only the linear layers, int8 convolutions (ConvInteger) are
+    # --- slower than float32 ones on CPU
+    quantize_dynamic(
+        output_file,
+        quantized_file,
+        op_types_to_quantize=["MatMul"],
+        weight_type=QuantType.QInt8,
+    )
+    return quantized_file
+
+
+class SsmNetRuntime:
+    """
+    Run SSM-Net with one of the backends of BACKEND_L, same interface for all:
+    m_run(feat_3m) -> hat_novelty_v, embedding_m (torch tensors)
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        ssm_model: Optional[model.SsmNet] = None,
+        export_file: Optional[str] = None,
+        quantize: bool = False,
+    ):
+        """
+        Args:
+            backend: "eager", "torchscript" or "onnx"
+            ssm_model: needed for "eager"
+            export_file: file written by f_export_torchscript / f_export_onnx
+            quantize: dynamic int8 quantization (eager only, exported graphs are
+                quantized at export time)
+        """
+        if backend not in BACKEND_L:
+            raise ValueError(f"backend must be one of {BACKEND_L}, got {backend}")
+        self.backend = backend
+        if backend == "eager":
+            module = SsmNetExport(ssm_model).eval()
+            self.module = f_quantize(module) if quantize else module
+        elif backend == "torchscript":
+            self.module = torch.jit.load(export_file, map_location="cpu")
+        else:
+            if not ONNXRUNTIME_AVAILABLE:
+                raise ModuleNotFoundError(
+                    'The "onnx" backend requires onnxruntime to be installed.'
+                )
+            import onnxruntime
+
+            self.session = onnxruntime.InferenceSession(
+                export_file, providers=["CPUExecutionProvider"]
+            )
+        return
+
+    def m_run(self, feat_3m: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Args:
+            feat_3m (T, f=80, t=40)
+        Returns:
+            hat_novelty_v (T,)
+            embedding_m (T, dim_embed)
+        """
+        if self.backend == "onnx":
+            hat_novelty_np, embedding_np = self.session.run(
+                None, {"feat_3m": np.ascontiguousarray(feat_3m.numpy(), dtype=np.float32)}
+            )
+            return torch.from_numpy(hat_novelty_np), torch.from_numpy(embedding_np)
+        with torch.inference_mode():
+            return self.module(feat_3m)
+
+
+def f_parity(
+    reference: SsmNetRuntime, runtime: SsmNetRuntime, feat_3m: torch.Tensor
+) -> dict:
+    """
+    Compare two runtimes on the same input
+
+    Args:
+        reference
+        runtime
+        feat_3m (T, f=80, t=40)
+    Returns:
+        dictionary with the maximum absolute difference of the novelty-curves and SSMs
+    """
+    ref_novelty_v, ref_embedding_m = reference.m_run(feat_3m)
+    novelty_v, embedding_m = runtime.m_run(feat_3m)
+    return {
+        "novelty_max_abs_diff": float((ref_novelty_v - novelty_v).abs().max()),
+        "ssm_max_abs_diff": float(
+            (
+                model.f_ssm_from_embedding(ref_embedding_m)
+                - model.f_ssm_from_embedding(embedding_m)
+            )
+            .abs()
+            .max()
+        ),
+    }
+
+
+def f_latency(runtime: SsmNetRuntime, feat_3m: torch.Tensor, nb_run: int = 10) -> dict:
+    """
+    Args:
+        runtime
+        feat_3m (T, f=80, t=40)
+        nb_run: number of timed runs (after one warm-up run)
+    Returns:
+        dictionary with the median latency and the throughput in patches per second
+    """
+    runtime.m_run(feat_3m)
+    time_l = []
+    for _ in range(nb_run):
+        start_time = time.perf_counter()
+        runtime.m_run(feat_3m)
+        time_l.append(time.perf_counter() - start_time)
+    latency_sec = float(np.median(time_l))
+    return {
+        "latency_ms": 1000 * latency_sec,
+        "patch_per_sec": feat_3m.shape[0] / latency_sec,
+    }
+
+
+def ssmnet_export_main():
+    parser = argparse.ArgumentParser(
+        description="Export SSM-Net to TorchScript/ONNX, check parity and measure CPU latency"
+    )
+    parser.add_argument(
+        "-c", "--config_file", default="config_example.yaml",
+        help="yaml configuration file (in weights_deploy)",
+    )
+    parser.add_argument("-o", "--output_dir", default=".", help="folder of the exported files")
+    parser.add_argument(
+        "-a", "--audio_file",
+        help="audio file used as example input and for the checks (default: random features)",
+    )
+    parser.add_argument(
+        "--nb_patch", type=int, default=400,
+        help="number of random patches when no audio file is given",
+    )
+    parser.add_argument("--quantize", action="store_true", help="dynamic int8 quantization")
+    parser.add_argument("--no_onnx", action="store_true", help="skip the ONNX export")
+    parser.add_argument("--nb_run", type=int, default=10, help="number of timed runs")
+    args = parser.parse_args()
+
+    import yaml
+
+    from .core import SsmNetDeploy
+
+    config_file = os.path.join(os.path.dirname(__file__), "weights_deploy", args.config_file)
+    with open(config_file, "r", encoding="utf-8") as fid:
+        config_d = yaml.safe_load(fid)
+
+    ssmnet_deploy = SsmNetDeploy(config_d)
+    if args.audio_file:
+        feat_3m, _ = ssmnet_deploy.m_get_features(args.audio_file)
+        feat_3m = torch.from_numpy(np.ascontiguousarray(feat_3m, dtype=np.float32))
+    else:
+        # --- step_sec of m_get_features: 22050 Hz, hop 512, reduced to step_target_sec,
+        # --- then patch_hop_frame
+        frame_sec = 512 / 22050
+        reduce_factor = int(np.floor(config_d["features"]["step_target_sec"] / frame_sec))
+        ssmnet_deploy.step_sec = (
+            reduce_factor * frame_sec * config_d["features"]["patch_hop_frame"]
+        )
+        feat_3m = torch.randn(
+            (args.nb_patch, 80, 2 * config_d["features"]["patch_halfduration_frame"])
+        )
+    ssm_model = ssmnet_deploy.m_get_model()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(config_d["model"]["file"]))[0]
+    suffix = "_int8" if args.quantize else ""
+
+    runtime_d = {"eager": SsmNetRuntime("eager", ssm_model)}
+    if args.quantize:
+        runtime_d["eager_int8"] = SsmNetRuntime("eager", ssm_model, quantize=True)
+
+    ts_file = os.path.join(args.output_dir, f"{name}{suffix}.ts.pt")
+    f_export_torchscript(
+        f_quantize(ssm_model) if args.quantize else ssm_model, feat_3m, ts_file
+    )
+    print(f'wrote "{ts_file}"')
+    runtime_d[f"torchscript{suffix}"] = SsmNetRuntime("torchscript", export_file=ts_file)
+
+    if not args.no_onnx:
+        onnx_file = os.path.join(args.output_dir, f"{name}.onnx")
+        quantized_file = f_export_onnx(
+            ssm_model, feat_3m, onnx_file, quantize=args.quantize and ONNXRUNTIME_AVAILABLE
+        )
+        print(f'wrote "{onnx_file}"')
+        if quantized_file != onnx_file:
+            print(f'wrote "{quantized_file}"')
+        if ONNXRUNTIME_AVAILABLE:
+            runtime_d["onnx"] = SsmNetRuntime("onnx", export_file=onnx_file)
+            if quantized_file != onnx_file:
+                runtime_d["onnx_int8"] = SsmNetRuntime("onnx", export_file=quantized_file)
+        else:
+            print("onnxruntime is not installed, skipping the ONNX checks")
+
+    # --- the reference is the eager float32 model built from the .pt weights
+    result_d = {}
+    for backend, runtime in runtime_d.items():
+        result_d[backend] = {
+            **f_parity(runtime_d["eager"], runtime, feat_3m),
+            **f_latency(runtime, feat_3m, args.nb_run),
+        }
+        print(
+            f'{backend:>16}: novelty diff {result_d[backend]["novelty_max_abs_diff"]:.2e}, '
+            f'ssm diff {result_d[backend]["ssm_max_abs_diff"]:.2e}, '
+            f'{result_d[backend]["latency_ms"]:.1f} ms, '
+            f'{result_d[backend]["patch_per_sec"]:.0f} patch/sec'
+        )
+
+    with open(os.path.join(args.output_dir, f"{name}{suffix}_export.json"), "w") as fid:
+        json.dump({"nb_patch": feat_3m.shape[0], "result": result_d}, fid, indent=2)
+
+
+if __name__ == "__main__":
+    ssmnet_export_main()
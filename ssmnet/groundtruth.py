@@ -0,0 +1,189 @@
+"""
+Ground-truth structure annotations of the .pyjama collections (groundtruth/*.pyjama).
+
+Each collection is parsed once into a columnar cache (one .npy file per column, all
+segments of all tracks back to back, plus the offset of each track), which is
+memory-mapped on later runs:
+
+    gt = GroundTruth.m_load("groundtruth/rwc-pop.pyjama")
+    start_v, stop_v, label_v = gt.m_get_segments("RM-P001.wav")
+    gt_SSM_m, gt_novelty_v = utils.f_groundtruth_from_segments(time_sec_v, start_v, stop_v, label_v)
+"""
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# --- increase when the cache layout changes
+CACHE_VERSION = 1
+COLUMN_L = ["start", "stop", "label", "offset"]
+
+
+def f_parse_pyjama(pyjama_file: str) -> Tuple[List[str], List[str], Dict[str, np.ndarray]]:
+    """
+    Parse a .pyjama collection into columns
+
+    Args:
+        pyjama_file
+    Returns:
+        track_l: filepath of each track
+        label_name_l: label vocabulary of the collection
+        column_d: start (nb_seg,), stop (nb_seg,), label (nb_seg,) index in label_name_l,
+            offset (nb_track+1,): the segments of track n are offset[n]:offset[n+1]
+    """
+    with open(pyjama_file, "r", encoding="utf-8") as fid:
+        data_d = json.load(fid)
+
+    track_l = []
+    start_l = []
+    duration_l = []
+    value_l = []
+    offset_l = [0]
+    for entry in data_d["collection"]["entry"]:
+        track_l.append(entry["filepath"][0]["value"])
+        for seg in entry.get("structure", []):
+            start_l.append(seg["time"])
+            duration_l.append(seg["duration"])
+            value_l.append(seg["value"])
+        offset_l.append(len(start_l))
+
+    label_name_v, label_v = np.unique(np.asarray(value_l, dtype=str), return_inverse=True)
+    start_v = np.asarray(start_l, dtype=np.float64)
+    column_d = {
+        "start": start_v,
+        "stop": start_v + np.asarray(duration_l, dtype=np.float64),
+        "label": label_v.astype(np.int32),
+        "offset": np.asarray(offset_l, dtype=np.int64),
+    }
+    return track_l, label_name_v.tolist(), column_d
+
+
+class GroundTruth:
+    """Segments of every track of a collection, stored by column"""
+
+    def __init__(self, track_l: List[str], label_name_l: List[str], column_d: dict):
+        """
+        Args:
+            track_l, label_name_l, column_d: see f_parse_pyjama
+        """
+        self.track_l = track_l
+        self.label_name_l = label_name_l
+        self.column_d = column_d
+        self.track_idx_d = {track: idx for idx, track in enumerate(track_l)}
+        return
+
+    @classmethod
+    def m_load(cls, pyjama_file: str, cache_dir: Optional[str] = None) -> "GroundTruth":
+        """
+        Load a collection from its cache, (re)building the cache if it is missing or
+        older than the .pyjama file
+
+        Args:
+            pyjama_file
+            cache_dir: cache folder (default: pyjama_file + ".cache")
+        Returns:
+            ground-truth, columns are read-only memory-maps
+        """
+        cache_dir = cache_dir or f"{pyjama_file}.cache"
+        stat = os.stat(pyjama_file)
+        source_d = {
+            "version": CACHE_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+
+        meta_file = os.path.join(cache_dir, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file, "r", encoding="utf-8") as fid:
+                meta_d = json.load(fid)
+            if meta_d["source"] == source_d:
+                column_d = {
+                    name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+                    for name in COLUMN_L
+                }
+                return cls(meta_d["track"], meta_d["label"], column_d)
+
+        track_l, label_name_l, column_d = f_parse_pyjama(pyjama_file)
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in COLUMN_L:
+            np.save(os.path.join(cache_dir, f"{name}.npy"), column_d[name])
+        # --- meta.json is written last: an interrupted build is rebuilt on the next run
+        tmp_file = f"{meta_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as fid:
+            json.dump({"source": source_d, "track": track_l, "label": label_name_l}, fid)
+        os.replace(tmp_file, meta_file)
+        return cls(track_l, label_name_l, column_d)
+
+    def __len__(self) -> int:
+        return len(self.track_l)
+
+    def __contains__(self, track: str) -> bool:
+        return track in self.track_idx_d
+
+    def m_get_segments(self, track: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Args:
+            track: filepath of the track in the collection
+        Returns:
+            start_v (nb_seg,), stop_v (nb_seg,), label_v (nb_seg,): label index in label_name_l
+        """
+        idx = self.track_idx_d[track]
+        seg_slice = slice(
+            self.column_d["offset"][idx], self.column_d["offset"][idx + 1]
+        )
+        return (
+            self.column_d["start"][seg_slice],
+            self.column_d["stop"][seg_slice],
+            self.column_d["label"][seg_slice],
+        )
+
+    def m_get_annot_l(self, track: str) -> List[dict]:
+        """
+        Args:
+            track: filepath of the track in the collection
+        Returns:
+            annot_l: the segments in the .pyjama format ('time', 'duration', 'value')
+        """
+        start_v, stop_v, label_v = self.m_get_segments(track)
+        return [
+            {
+                "time": float(start),
+                "duration": float(stop - start),
+                "value": self.label_name_l[label],
+            }
+            for start, stop, label in zip(start_v, stop_v, label_v)
+        ]
+
+
+def f_build_cache(pyjama_file: str):
+    """
+    Build the cache of a collection if needed (run in the workers of f_load_groundtruth_l)
+
+    Args:
+        pyjama_file
+    """
+    GroundTruth.m_load(pyjama_file)
+    return
+
+
+def f_load_groundtruth_l(
+    pyjama_file_l: List[str], workers: Optional[int] = None
+) -> Dict[str, GroundTruth]:
+    """
+    Load several collections, the caches that need to be (re)built are built in
+    parallel processes
+
+    Args:
+        pyjama_file_l
+        workers: number of processes (default: one per collection)
+    Returns:
+        ground-truth of each collection, keyed by pyjama file
+    """
+    with ProcessPoolExecutor(max_workers=workers or len(pyjama_file_l) or 1) as executor:
+        # --- the workers build the caches, the memory-maps are opened here
+        list(executor.map(f_build_cache, pyjama_file_l))
+    return {pyjama_file: GroundTruth.m_load(pyjama_file) for pyjama_file in pyjama_file_l}
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import contextlib
+
 import numpy as np
 from numpy.linalg import norm
 
@@ -10,7 +12,7 @@ from torch.utils.data import Dataset
 from torch.utils.data import DataLoader
 import torch.optim as optim
 
-from typing import Tuple
+from typing import Callable, ContextManager, Optional, Tuple
 
 
 class SsmNet(nn.Module):
@@ -64,6 +66,8 @@ class SsmNet(nn.Module):
         self.conv = nn.Sequential(*conv_l)
 
         self.resize = 128
+        # --- number of patches processed at once by the conv layers, see m_conv
+        self.conv_batch = 64
 
         # -------------------------------------
         self.attention_l = []
@@ -77,6 +81,7 @@ class SsmNet(nn.Module):
         kernel_Ldemi = int(np.round(self.config["kernel_Ldemi_sec"] / step_sec))
         kernel_sigma = int(np.round(self.config["kernel_sigma_sec"] / step_sec))
         M = kernel_Ldemi * 2 + 1
+        self.kernel_Ldemi = kernel_Ldemi
         self.conv_novelty = nn.Conv2d(
             in_channels=1,
             out_channels=self.config["kernel_nb"],
@@ -115,7 +120,7 @@ class SsmNet(nn.Module):
         x = feat_4m.squeeze()  # remove n_batch dimension
         x = x.unsqueeze(1)  # add channel dimension (dim=1)
 
-        x = self.conv(x)
+        x = self.m_conv(x)
         # --- (m, C, f=1, t=1)
         x = x.view(-1, self.resize)
 
@@ -126,6 +131,57 @@ class SsmNet(nn.Module):
 
         return embedding_m
 
+    def m_conv(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Apply the conv layers conv_batch patches at a time: the patches are independent
+        and the activations of the first layers are large (32*80*40 values per patch).
+        The activations are channels-last: max-pooling the channels-first output of
+        the mkldnn convolutions is about as slow as the convolutions themselves on CPU.
+
+        Args:
+            x (T, 1, f=80, t=40)
+        Returns:
+            x (T, C=128, f=1, t=1)
+        """
+        # --- with a single channel, x.contiguous(memory_format=...) may keep the strides
+        x = torch.empty_like(x, memory_format=torch.channels_last).copy_(x)
+        return torch.cat([self.conv(x_b) for x_b in torch.split(x, self.conv_batch)])
+
+    def forward_batch(self, feat_3m_l: list) -> list:
+        """
+        Compute the embeddings of several tracks at once, the tracks are padded to the
+        same number of patches and the padding is masked in the attention layers
+
+        Args:
+            feat_3m_l: list of n_batch tensors (T_b, f=80, t=40)
+        Returns:
+            embedding_m_l: list of n_batch tensors (T_b, dim_embed)
+        """
+
+        nb_frame_l = [feat_3m.shape[0] for feat_3m in feat_3m_l]
+
+        # --- the conv layers process each patch independently -> all patches of all tracks together
+        # --- x (sum_b T_b, 1, f=80, t=40)
+        x = torch.cat(list(feat_3m_l), dim=0).unsqueeze(1)
+        x = self.m_conv(x)
+        x = x.view(-1, self.resize)
+
+        # --- x (T_max, n_batch, dim_embed), mask (n_batch, T_max) is True on padding
+        x = nn.utils.rnn.pad_sequence(torch.split(x, nb_frame_l))
+        mask = torch.ones((len(nb_frame_l), x.shape[0]), dtype=torch.bool)
+        for idx, nb_frame in enumerate(nb_frame_l):
+            mask[idx, :nb_frame] = False
+
+        for layer in self.attention:
+            x = layer(x, src_key_padding_mask=mask)
+
+        x = F.tanh(x)
+        embedding_3m = F.normalize(x, dim=2, p=2)
+
+        return [
+            embedding_3m[:nb_frame, idx, :] for idx, nb_frame in enumerate(nb_frame_l)
+        ]
+
     def get_ssm(self, feat_4m: np.ndarray) -> np.ndarray:
         """
         Compute embedding then hat_ssm
@@ -137,34 +193,188 @@ class SsmNet(nn.Module):
         """
 
         embedding_m = self.forward(feat_4m)
-        hat_ssm_m = 1 - (torch.cdist(embedding_m, embedding_m) ** 2) / 4
+        hat_ssm_m = f_ssm_from_embedding(embedding_m)
         return hat_ssm_m
 
     def get_novelty(
-        self, feat_4m: np.ndarray, get_ssm: bool
-    ) -> Tuple[np.ndarray, np.ndarray]:
+        self,
+        feat_4m: np.ndarray,
+        get_ssm: bool = True,
+        stage: Optional[Callable[..., ContextManager]] = None,
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
         """
-        Compute embedding then hat_ssm then hat_prob_boundary
+        Compute embedding then hat_prob_boundary, and hat_ssm if get_ssm.
+        The novelty is computed from the diagonals of hat_ssm only (see
+        get_novelty_from_band), the dense hat_ssm is only built when asked for.
 
         Args:
             feat_4m (n_batch=1, T, f=80, t=40)
+            get_ssm
+            stage: wraps each step, called as stage(name, **args) and returning a
+                context manager (e.g. profiling.Profiler.m_stage); default: nothing
         Returns:
             hat_prob_boundary (T,)
-            ssm_hat (T, T)
+            ssm_hat (T, T) or None if not get_ssm
         """
+        stage = stage or f_no_stage
 
         # --- x: (m, f=80, t=40)
+        with stage("embedding", nb_patch=feat_4m.shape[-3]):
+            embedding_m = self.forward(feat_4m)
+        with stage("conv_novelty"):
+            hat_novelty_v = self.get_novelty_from_band(
+                f_ssm_band(embedding_m, 2 * self.kernel_Ldemi)
+            )
         # --- ssm_hat (m, m)
-        hat_ssm_m = np.zeros_like((feat_4m.shape[0], feat_4m.shape[0]))
+        hat_ssm_m = None
         if get_ssm:
-            hat_ssm_m = self.get_ssm(feat_4m)
+            with stage("get_ssm"):
+                hat_ssm_m = f_ssm_from_embedding(embedding_m)
+
+        return hat_novelty_v, hat_ssm_m
+
+    def get_novelty_from_ssm(self, hat_ssm_m: torch.Tensor) -> torch.Tensor:
+        """
+        Compute hat_prob_boundary from hat_ssm with the dense 2D convolution
+        (same values as get_novelty_from_band, in O(T^2) memory)
+
+        Args:
+            hat_ssm_m (T, T)
+        Returns:
+            hat_prob_boundary (T,)
+        """
+
         # --- add back n_batch and channel dimension
         y = self.conv_novelty(hat_ssm_m.unsqueeze(0).unsqueeze(1))
         y = self.lin_novelty(y)
         y = F.sigmoid(y)
         hat_novelty_v = torch.diagonal(y.squeeze())
 
-        return hat_novelty_v, hat_ssm_m
+        return hat_novelty_v
+
+    def get_novelty_from_band(
+        self, hat_band_m: torch.Tensor, diagonal_weight_3m: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Compute hat_prob_boundary from the diagonals of hat_ssm only (see f_ssm_band).
+        Only the main diagonal of the conv_novelty output is used, and it only depends
+        on the diagonals -2*kernel_Ldemi..2*kernel_Ldemi of hat_ssm: the 2D kernel is
+        rewritten as a 1D convolution over these diagonals, so memory is O(T).
+
+        Args:
+            hat_band_m (4*kernel_Ldemi+1, T)
+            diagonal_weight_3m: precomputed m_get_diagonal_weight() (default: computed)
+        Returns:
+            hat_prob_boundary (T,)
+        """
+
+        if diagonal_weight_3m is None:
+            diagonal_weight_3m = self.m_get_diagonal_weight()
+        y = F.conv1d(
+            hat_band_m.unsqueeze(0),
+            diagonal_weight_3m,
+            self.conv_novelty.bias,
+            padding=self.kernel_Ldemi,
+        )
+        # --- lin_novelty is a (1,1) convolution -> same weights in 1D
+        y = F.conv1d(
+            y, self.lin_novelty.weight.flatten(start_dim=2), self.lin_novelty.bias
+        )
+        y = F.sigmoid(y)
+        hat_novelty_v = y[0, 0]
+
+        return hat_novelty_v
+
+    def m_get_diagonal_weight(self) -> torch.Tensor:
+        """
+        Rearrange the conv_novelty kernel by diagonal: weight_3m[k, d+2*Ldemi, a] is the
+        weight applied to hat_ssm[t+a-Ldemi, t+a-Ldemi+d] for the output at (t, t)
+
+        Returns:
+            weight_3m (kernel_nb, 4*kernel_Ldemi+1, 2*kernel_Ldemi+1)
+        """
+
+        M = 2 * self.kernel_Ldemi + 1
+        weight_3m = self.conv_novelty.weight[:, 0]
+        a_v = torch.arange(M)
+        d_v = torch.arange(-(M - 1), M)
+        b_m = a_v[None, :] + d_v[:, None]
+        valid_m = (b_m >= 0) & (b_m < M)
+        return weight_3m[:, a_v.expand_as(b_m), b_m.clamp(0, M - 1)] * valid_m
+
+    def get_novelty_batch(
+        self, feat_3m_l: list, get_ssm: bool = True
+    ) -> Tuple[list, list]:
+        """
+        Compute embedding then hat_prob_boundary (and hat_ssm if get_ssm) for several
+        tracks at once
+
+        Args:
+            feat_3m_l: list of n_batch tensors (T_b, f=80, t=40)
+            get_ssm
+        Returns:
+            hat_novelty_v_l: list of n_batch tensors (T_b,)
+            hat_ssm_m_l: list of n_batch tensors (T_b, T_b) (None if not get_ssm)
+        """
+
+        hat_novelty_v_l = []
+        hat_ssm_m_l = []
+        for embedding_m in self.forward_batch(feat_3m_l):
+            hat_band_m = f_ssm_band(embedding_m, 2 * self.kernel_Ldemi)
+            hat_novelty_v_l.append(self.get_novelty_from_band(hat_band_m))
+            hat_ssm_m_l.append(f_ssm_from_embedding(embedding_m) if get_ssm else None)
+
+        return hat_novelty_v_l, hat_ssm_m_l
+
+
+def f_no_stage(name: str, **args) -> ContextManager:
+    """
+    Default stage of get_novelty: does nothing
+    """
+    return contextlib.nullcontext()
+
+
+def f_ssm_from_embedding(embedding_m: torch.Tensor) -> torch.Tensor:
+    """
+    Compute the Self-Similarity-Matrix of unit-norm embeddings
+
+    Args:
+        embedding_m (T, dim_embed)
+    Returns:
+        hat_ssm_m (T, T)
+    """
+    return 1 - (torch.cdist(embedding_m, embedding_m) ** 2) / 4
+
+
+def f_ssm_band(embedding_m: torch.Tensor, width: int) -> torch.Tensor:
+    """
+    Compute only the diagonals -width..width of the Self-Similarity-Matrix of unit-norm
+    embeddings, in O(T * width) memory.
+    Written with shifts of constant size only, so that the graph traced by
+    torch.jit.trace / torch.onnx.export does not depend on T.
+
+    Args:
+        embedding_m (T, dim_embed)
+        width
+    Returns:
+        hat_band_m (2*width+1, T): hat_band_m[width+d, t] = hat_ssm_m[t, t+d] (0 outside the matrix)
+    """
+    # --- embedding_m[t+d] for t+d >= T is padding, valid_v masks it
+    pad_embedding_m = F.pad(embedding_m, (0, 0, 0, width))
+    pad_valid_v = F.pad(torch.ones_like(embedding_m[:, 0]), (0, width))
+
+    lower_l = []
+    upper_l = []
+    for d in range(1, width + 1):
+        stop = d - width if d < width else None
+        diag_v = 1 - ((pad_embedding_m[d:stop] - embedding_m) ** 2).sum(dim=1) / 4
+        # --- diag_v[t] = hat_ssm_m[t, t+d] = hat_ssm_m[t+d, t]
+        diag_v = diag_v * pad_valid_v[d:stop]
+        upper_l.append(diag_v)
+        lower_l.append(F.pad(diag_v, (d, 0))[:-d])
+
+    diag0_v = torch.ones_like(embedding_m[:, 0])
+    return torch.stack(lower_l[::-1] + [diag0_v] + upper_l)
 
 
 def f_checkerboard_kernel(Ldemi: int = 10, sigma: float = 5) -> np.ndarray:
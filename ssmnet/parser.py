@@ -4,12 +4,43 @@ def parse_args():
     
     parser = ArgumentParser(description='Compute SSM, novelty and boundaries using SSM-Net')
     parser.add_argument("audio_file", 
-                        help='audio file to process')
+                        help='audio file to process, or a directory, a glob pattern (quoted) or a manifest (.txt with one audio file per line) for batch mode')
     parser.add_argument("-o", "--output_csv_file", default="output.csv",
                         help='output csv file that contains the boundary positions [in sec]')
     parser.add_argument("-p", "--output_pdf_file", default="output.pdf",
                         help='output pdf file with SSM, novelty-curve and detected boundaries')
+    parser.add_argument("-d", "--output_dir", default=".",
+                        help='batch mode: folder of the per-track csv and pdf files (same relative paths as the audio files, e.g. song.wav.csv)')
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help='batch mode: number of processes decoding audio and computing features (default: number of CPUs)')
+    parser.add_argument("--no_pdf", action="store_true",
+                        help='batch mode: only write the csv files')
+    parser.add_argument("--overwrite", action="store_true",
+                        help='batch mode: also process tracks whose csv file already exists')
     parser.add_argument("-c", "--config_file", default="config_example.yaml",
                         help='fullpath to a yaml configuration file')
+    parser.add_argument("--chunk_patch", type=int, default=0,
+                        help='process long files by chunks of this many patches in O(T) memory (0: whole file at once), implies --novelty_only')
+    parser.add_argument("--context_patch", type=int, default=128,
+                        help='patches of context on each side of a chunk')
+    parser.add_argument("--novelty_only", action="store_true",
+                        help='do not compute the dense SSM, the pdf only shows the novelty-curve and boundaries')
+    parser.add_argument("--cache_dir", default=None,
+                        help='folder of the feature cache (default: no cache)')
+    parser.add_argument("--cache_max_mb", type=float, default=1024,
+                        help='maximum size of the feature cache, least recently used files are removed first')
+    parser.add_argument("--backend", default="eager", choices=["eager", "torchscript", "onnx"],
+                        help='inference backend, "torchscript" and "onnx" need --export_file')
+    parser.add_argument("--export_file", default=None,
+                        help='graph written by ssmnet-export (with the same configuration file)')
+    parser.add_argument("--quantize", action="store_true",
+                        help='dynamic int8 quantization of the linear layers (eager backend)')
+    parser.add_argument("--profile", default=None, metavar="TRACE_JSON",
+                        help='time each stage and write a Chrome trace (chrome://tracing, ui.perfetto.dev); '
+                             'in batch mode, also one trace per track next to its csv (.trace.json)')
+    parser.add_argument("--profile_memory", action="store_true",
+                        help='with --profile, also record the memory peak of each stage')
+    parser.add_argument("--profile_torch", action="store_true",
+                        help='with --profile, also capture a torch.profiler trace (TRACE_torch.json)')
     
     return parser.parse_args()
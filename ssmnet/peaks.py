@@ -0,0 +1,59 @@
+"""Peak picking on novelty curves, shared by ssmnet.utils and ssm_utils"""
+
+import numpy as np
+from scipy.signal import find_peaks
+
+
+def f_peak_to_mean(data_v: np.ndarray, param_Thalf: int) -> np.ndarray:
+    """
+    Ratio between each value and its local mean over [nu-param_Thalf, nu+param_Thalf]
+    (the window is truncated at the borders), 0 where the local mean is 0.
+    The moving sum is obtained from a cumulative sum, so the cost is O(nb_frame).
+
+    Args:
+        data_v (nb_frame,)
+        param_Thalf
+    Returns:
+        peak_to_mean_v (nb_frame,)
+    """
+
+    nb_frame = len(data_v)
+    cumsum_v = np.concatenate((np.zeros(1), np.cumsum(data_v, dtype=np.float64)))
+    nu_v = np.arange(nb_frame)
+    sss_v = np.maximum(0, nu_v - param_Thalf)
+    eee_v = np.minimum(nu_v + param_Thalf + 1, nb_frame)
+    local_mean_v = (cumsum_v[eee_v] - cumsum_v[sss_v]) / (eee_v - sss_v)
+
+    peak_to_mean_v = np.zeros((nb_frame))
+    nonzero_v = local_mean_v != 0
+    peak_to_mean_v[nonzero_v] = data_v[nonzero_v] / local_mean_v[nonzero_v]
+
+    return peak_to_mean_v
+
+
+def f_pick_peaks(
+    data_v: np.ndarray, param_Thalf: int, param_tau: float, param_distance: int
+) -> np.ndarray:
+    """
+    Detect peaks of a function, peaks are local maxima of the peak-to-mean ratio
+    above a threshold
+
+    Args:
+        data_v (nb_frame,)
+        param_Thalf: half-size of the local mean window [frame]
+        param_tau: threshold on the peak-to-mean ratio
+        param_distance: minimal distance between two peaks [frame]
+    Returns:
+        peak_frame_v
+    """
+
+    # --- Compute peak_to_mean ratio
+    peak_to_mean_v = f_peak_to_mean(data_v, param_Thalf)
+
+    # --- Find peaks
+    peaks, _ = find_peaks(peak_to_mean_v, distance=param_distance)
+
+    # --- Above threshold tau
+    above_treshold = np.where(peak_to_mean_v[peaks] >= param_tau)[0]
+
+    return peaks[above_treshold]
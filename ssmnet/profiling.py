@@ -0,0 +1,184 @@
+"""
+Per-stage instrumentation of SsmNetDeploy.
+
+    profiler = Profiler(track_memory=True)
+    ssmnet_deploy = SsmNetDeploy(config_d, profiler=profiler)
+    with profiler.m_stage("my_stage", audio_file=audio_file):
+        ...
+    profiler.m_export_chrome_trace("trace.json")  # chrome://tracing or https://ui.perfetto.dev
+
+Stages can be nested. A disabled profiler (the default of SsmNetDeploy) does nothing.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Optional
+
+
+class Profiler:
+    """Context-manager timers, optional memory tracking and optional torch.profiler capture"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        track_memory: bool = False,
+        torch_profile: bool = False,
+        origin_ns: Optional[int] = None,
+    ):
+        """
+        Args:
+            enabled: if False, m_stage does nothing
+            track_memory: record the peak of numpy/python allocations (tracemalloc) and the
+                peak RSS of the process at the end of each stage
+            torch_profile: also capture a torch.profiler trace, where each stage is a
+                record_function range (exported next to the trace, with a _torch suffix)
+            origin_ns: time.perf_counter_ns() of the start of the trace (default: now);
+                profilers of other processes given the same origin share the time axis
+        """
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.torch_profile = enabled and torch_profile
+        self.event_l = []
+        self.origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+        # --- running peak of tracemalloc for each open stage (innermost last)
+        self.peak_l = []
+        self.torch_profiler = None
+
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.torch_profile:
+            import torch
+
+            self.torch_profiler = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                record_shapes=True,
+                profile_memory=track_memory,
+            )
+            self.torch_profiler.start()
+        return
+
+    @contextlib.contextmanager
+    def m_stage(self, name: str, **args):
+        """
+        Time the enclosed block as a stage
+
+        Args:
+            name: name of the stage
+            args: extra information stored with the stage (e.g. the audio file)
+        """
+        if not self.enabled:
+            yield
+            return
+
+        record_function = contextlib.nullcontext()
+        if self.torch_profiler is not None:
+            import torch
+
+            record_function = torch.profiler.record_function(name)
+        if self.track_memory:
+            self.m_update_peak()
+            self.peak_l.append(tracemalloc.get_traced_memory()[0])
+
+        start_ns = time.perf_counter_ns()
+        try:
+            with record_function:
+                yield
+        finally:
+            stop_ns = time.perf_counter_ns()
+            if self.track_memory:
+                self.m_update_peak()
+                args["alloc_peak_mb"] = self.peak_l.pop() / 2**20
+                args["rss_peak_mb"] = f_peak_rss_mb()
+            self.event_l.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start_ns - self.origin_ns) / 1000,
+                    "dur": (stop_ns - start_ns) / 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    def m_update_peak(self):
+        """
+        Propagate the tracemalloc peak to all open stages, then reset it (so that
+        nested stages each get their own peak)
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak_l = [max(value, peak) for value in self.peak_l]
+        tracemalloc.reset_peak()
+        return
+
+    def m_add_events(self, event_l: List[dict]):
+        """
+        Add the stages recorded by another profiler with the same origin_ns (e.g. in a
+        worker process)
+
+        Args:
+            event_l: event_l of the other profiler
+        """
+        if self.enabled:
+            self.event_l.extend(event_l)
+        return
+
+    def m_summary(self) -> dict:
+        """
+        Returns:
+            total time in seconds and number of calls of each stage
+        """
+        summary_d = {}
+        for event in self.event_l:
+            stage_d = summary_d.setdefault(event["name"], {"sec": 0.0, "count": 0})
+            stage_d["sec"] += event["dur"] / 1e6
+            stage_d["count"] += 1
+        return summary_d
+
+    def m_export_chrome_trace(self, output_file: str, **metadata):
+        """
+        Write the stages in the Chrome trace format (JSON object format), with the
+        summary in "otherData"
+
+        Args:
+            output_file: .json file
+            metadata: extra information stored in "otherData" (e.g. the audio file)
+        """
+        if not self.enabled:
+            return
+        if self.torch_profiler is not None:
+            self.torch_profiler.stop()
+            root, ext = os.path.splitext(output_file)
+            self.torch_profiler.export_chrome_trace(f"{root}_torch{ext or '.json'}")
+            self.torch_profiler = None
+
+        with open(output_file, "w", encoding="utf-8") as fid:
+            json.dump(
+                {
+                    "traceEvents": self.event_l,
+                    "displayTimeUnit": "ms",
+                    "otherData": {**metadata, "summary": self.m_summary()},
+                },
+                fid,
+            )
+        return
+
+
+def f_peak_rss_mb() -> Optional[float]:
+    """
+    Returns:
+        peak resident set size of the process (ru_maxrss is in KB on Linux, bytes on macOS),
+        None where the resource module does not exist (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from typing import Tuple
+from typing import Iterator, Tuple
 
 import librosa
+import soundfile
+import soxr
 import torch
 import numpy as np
 from scipy.signal import convolve
-from scipy.signal import find_peaks
+
+from .peaks import f_pick_peaks
 
 
 def f_weighted_bce_loss(hat_y, y):
@@ -56,22 +59,7 @@ def f_get_peaks(data_v, config_d, step_sec):
     param_distance = int(np.round(config_d["peak_distance_sec"] / step_sec))
     param_tau = config_d["peak_threshold"]
 
-    nb_frame = len(data_v)
-
-    # --- Compute peak_to_mean ratio
-    peak_to_mean_v = np.zeros((nb_frame))
-    for nu in range(0, nb_frame):
-        sss = max(0, nu - param_Thalf)
-        eee = min(nu + param_Thalf + 1, nb_frame)
-        local_mean = np.sum(data_v[sss:eee]) / (eee - sss)
-        peak_to_mean_v[nu] = data_v[nu] / local_mean
-
-    # --- Find peaks
-    peaks, _ = find_peaks(peak_to_mean_v, distance=param_distance)
-
-    # --- Above threshold tau
-    above_treshold = np.where(peak_to_mean_v[peaks] >= param_tau)[0]
-    est_boundary_frame_v = peaks[above_treshold]
+    est_boundary_frame_v = f_pick_peaks(data_v, param_Thalf, param_tau, param_distance)
 
     return est_boundary_frame_v
 
@@ -104,6 +92,120 @@ def f_extract_feature(
     return logmel_m, time_sec_v
 
 
+def f_extract_feature_stream(
+    audio_file: str, step_target_sec: float, block_sec: float = 60.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the same features as librosa.load + f_extract_feature + f_reduce_time,
+    reading the audio block by block, so that the audio and the full-rate log-mel are
+    never in memory at once.
+    As in librosa.load, the blocks are decoded with soundfile, down-mixed to mono and
+    resampled to 22050 Hz with soxr (HQ), here as a stream. The frames are those of
+    f_extract_feature (n_fft=2048, hop_length=512, centered with zero padding): the
+    samples a frame needs are kept from one block to the next, so the block edges
+    do not change the features.
+
+    Args:
+        audio_file (str)
+        step_target_sec (float)
+        block_sec (float): duration of the audio blocks
+
+    Returns:
+        logmel_sync_m    (np.ndarray)
+        time_sync_sec_v  (np.ndarray)
+    """
+
+    # --- librosa.load and librosa.feature.melspectrogram defaults
+    sr_hz = 22050
+    n_fft = 2048
+    hop_length = 512
+    step_sec = hop_length / sr_hz
+    reduce_factor = int(np.floor(step_target_sec / step_sec))
+
+    gamma = 100
+    sum_v = np.zeros(80)
+    sum2_v = np.zeros(80)
+    nb_frame = 0
+    logmel_sync_l = []
+    # --- frames waiting for the end of their group of reduce_factor frames
+    rest_m = np.zeros((80, 0), dtype=np.float32)
+    # --- centered frames: the signal is padded with n_fft // 2 zeros on both sides
+    buffer_v = np.zeros(n_fft // 2, dtype=np.float32)
+
+    with soundfile.SoundFile(audio_file) as sound_file:
+        native_sr_hz = sound_file.samplerate
+        block_frame = max(1, int(block_sec * native_sr_hz))
+        resampler = None
+        if native_sr_hz != sr_hz:
+            resampler = soxr.ResampleStream(
+                native_sr_hz, sr_hz, 1, dtype="float32", quality="HQ"
+            )
+        # --- librosa.load fixes the length of the resampled signal to this
+        nb_sample = int(np.ceil(sound_file.frames * sr_hz / native_sr_hz))
+        nb_read = 0
+
+        last = False
+        while not last:
+            block_m = sound_file.read(block_frame, dtype="float32", always_2d=True)
+            last = len(block_m) < block_frame or sound_file.tell() >= sound_file.frames
+            audio_v = block_m.mean(axis=1)
+            if resampler is not None:
+                audio_v = resampler.resample_chunk(audio_v, last=last)
+            audio_v = audio_v[: nb_sample - nb_read]
+            nb_read += len(audio_v)
+            if last:
+                audio_v = np.concatenate(
+                    (audio_v, np.zeros(nb_sample - nb_read + n_fft // 2, dtype=np.float32))
+                )
+            buffer_v = np.concatenate((buffer_v, audio_v))
+            if len(buffer_v) < n_fft:
+                continue
+
+            # --- all the frames that fit in the buffer, the rest waits for the next block
+            nb_new = (len(buffer_v) - n_fft) // hop_length + 1
+            mel_m = librosa.feature.melspectrogram(
+                y=buffer_v[: (nb_new - 1) * hop_length + n_fft],
+                sr=sr_hz,
+                n_fft=n_fft,
+                hop_length=hop_length,
+                n_mels=80,
+                fmax=8000,
+                center=False,
+            )
+            buffer_v = buffer_v[nb_new * hop_length :]
+
+            logmel_m = np.log(1 + gamma * mel_m)
+            sum_v += logmel_m.sum(axis=1)
+            sum2_v += (logmel_m.astype(np.float64) ** 2).sum(axis=1)
+            nb_frame += logmel_m.shape[1]
+
+            logmel_m = np.concatenate((rest_m, logmel_m), axis=1)
+            nb_group = logmel_m.shape[1] // reduce_factor
+            logmel_sync_l.append(
+                logmel_m[:, : nb_group * reduce_factor]
+                .reshape(80, nb_group, reduce_factor)
+                .mean(axis=2)
+            )
+            rest_m = logmel_m[:, nb_group * reduce_factor :]
+
+    # --- same number of frames as f_reduce_time: the last (possibly partial) group is dropped
+    nb_sync = max(int(np.ceil(nb_frame / reduce_factor)) - 1, 0)
+    logmel_sync_m = np.concatenate([np.zeros((80, 0))] + logmel_sync_l, axis=1)[:, :nb_sync]
+
+    # --- the normalization is affine, it can be applied after averaging
+    mean_v = sum_v / max(nb_frame, 1)
+    std_v = np.sqrt(np.maximum(sum2_v / max(nb_frame, 1) - mean_v**2, 0))
+    logmel_sync_m = (logmel_sync_m - mean_v[:, None]) / (
+        std_v[:, None] + np.finfo(float).eps
+    )
+
+    # --- as f_reduce_time: middle of the first frames of two consecutive groups
+    time_sec_v = np.arange(nb_sync + 1) * reduce_factor * step_sec
+    time_sync_sec_v = 0.5 * (time_sec_v[:-1] + time_sec_v[1:])
+
+    return logmel_sync_m.astype(np.float32), time_sync_sec_v
+
+
 def f_reduce_time(
     data_m: np.ndarray, time_sec_v: np.ndarray, step_target_sec: float
 ) -> Tuple[np.ndarray, np.ndarray]:
@@ -144,7 +246,9 @@ def f_patches(
     patch_hop_frame: int = 10,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Convert data_m to a list of patches of length 2*patch_halfduration_frame
+    Convert data_m to a list of patches of length 2*patch_halfduration_frame.
+    The patches are a sliding-window view of data_m (no copy): overlapping patches
+    share memory with each other and with data_m, do not write to them.
 
     Args:
         data (dim, nb_frame)
@@ -155,22 +259,77 @@ def f_patches(
         time (nb_patch,)
     """
 
-    middle_frame = patch_halfduration_frame
-    nb_frame = data_m.shape[1]
-    data_l = []
-    time_sec_l = []
-    while middle_frame + patch_halfduration_frame < nb_frame:
-        data_l.append(
-            data_m[
-                :,
-                middle_frame
-                - patch_halfduration_frame : middle_frame
-                + patch_halfduration_frame,
-            ]
+    patch_frame = 2 * patch_halfduration_frame
+    dim, nb_frame = data_m.shape
+    # --- patches are centered on frames patch_halfduration_frame + k*patch_hop_frame
+    # --- while middle_frame + patch_halfduration_frame < nb_frame
+    nb_patch = len(
+        range(
+            patch_halfduration_frame,
+            nb_frame - patch_halfduration_frame,
+            patch_hop_frame,
+        )
+    )
+    if nb_patch == 0:
+        return (
+            np.zeros((0, dim, patch_frame), dtype=data_m.dtype),
+            np.zeros(0, dtype=np.asarray(time_sec_v).dtype),
+        )
+
+    # --- (dim, nb_frame-patch_frame+1, patch_frame) -> (nb_patch, dim, patch_frame)
+    # --- writeable so that torch.from_numpy accepts it without copy
+    data_3m = np.lib.stride_tricks.sliding_window_view(
+        data_m, patch_frame, axis=1, writeable=True
+    )
+    data_3m = data_3m[:, : nb_patch * patch_hop_frame : patch_hop_frame].transpose(
+        1, 0, 2
+    )
+    time_patch_sec_v = np.asarray(time_sec_v)[
+        patch_halfduration_frame : patch_halfduration_frame
+        + nb_patch * patch_hop_frame : patch_hop_frame
+    ]
+    return data_3m, time_patch_sec_v
+
+
+def f_iter_patches(
+    data_m: np.ndarray,
+    time_sec_v: np.ndarray,
+    patch_halfduration_frame: int = 20,
+    patch_hop_frame: int = 10,
+    batch_patch: int = 256,
+    context_patch: int = 0,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, slice]]:
+    """
+    Same patches as f_patches, built lazily batch_patch at a time into a contiguous
+    float32 array (only one batch is materialized at once); each batch can also hold
+    up to context_patch patches before and after it (shared with the previous and
+    next batches)
+
+    Args:
+        data (dim, nb_frame)
+        time_sec_v (nb_frame,)
+        batch_patch: number of patches per batch
+        context_patch: number of extra patches on both sides of a batch
+
+    Yields:
+        data (<=batch_patch+2*context_patch, dim, 2*patch_halfduration_frame)
+        time (<=batch_patch+2*context_patch,)
+        batch_slice: position of the batch (without its context) in data and time
+    """
+
+    data_3m, time_patch_sec_v = f_patches(
+        data_m, time_sec_v, patch_halfduration_frame, patch_hop_frame
+    )
+    nb_patch = len(data_3m)
+    for start in range(0, nb_patch, batch_patch):
+        stop = min(start + batch_patch, nb_patch)
+        first = max(0, start - context_patch)
+        last = min(nb_patch, stop + context_patch)
+        yield (
+            np.ascontiguousarray(data_3m[first:last], dtype=np.float32),
+            time_patch_sec_v[first:last],
+            slice(start - first, stop - first),
         )
-        time_sec_l.append(time_sec_v[middle_frame])
-        middle_frame += patch_hop_frame
-    return np.asarray(data_l), np.asarray(time_sec_l)
 
 
 def f_groundtruth_from_annotation(
@@ -187,30 +346,56 @@ def f_groundtruth_from_annotation(
         gt_novelty_v (nb_frame,):
     """
 
-    # --- get the total number of class
-    dict_label_l = list(set([seg["value"] for seg in annot_l]))
-    nb_class = len(dict_label_l)
-
-    # --- for segment, check A < time_sec_v < B, assign the correponding class
-    label_state_m = np.zeros((nb_class, len(time_sec_v)))
-    label_state_v = np.zeros((len(time_sec_v)))
-    # label_seq_m = np.zeros((nb_class*1000, len(time_sec_v)))
-    for seg in annot_l:
-        class_idx = dict_label_l.index(seg["value"])
-        pos_v = np.where(
-            (seg["time"] < time_sec_v) & (time_sec_v <= seg["time"] + seg["duration"])
-        )[0]
-        # --- state
-        label_state_m[class_idx, pos_v] = 1
-        label_state_v[pos_v] = class_idx
-        # --- sequence
-        # for idx, pos in enumerate(pos_v):
-        #    label_seq_m[(class_idx*1000)+idx, pos:pos+3] = 1
+    start_v = np.asarray([seg["time"] for seg in annot_l], dtype=np.float64)
+    stop_v = start_v + np.asarray([seg["duration"] for seg in annot_l], dtype=np.float64)
+    _, label_v = np.unique(
+        np.asarray([seg["value"] for seg in annot_l], dtype=str), return_inverse=True
+    )
+    return f_groundtruth_from_segments(time_sec_v, start_v, stop_v, label_v)
+
+
+def f_groundtruth_from_segments(
+    time_sec_v: np.ndarray, start_v: np.ndarray, stop_v: np.ndarray, label_v: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Construct a ground-truth Self-Similarity-Matrix (SSM) and novelvely curve from
+    segments given as columns (see groundtruth.GroundTruth.m_get_segments)
+
+    Args:
+        time_sec_v (nb_frame,): target time axis of the SSM
+        start_v (nb_seg,): start time of the segments
+        stop_v (nb_seg,): stop time of the segments
+        label_v (nb_seg,): label of the segments (integers)
+    Returns:
+        gt_SSM_m (nb_frame, nb_frame):
+        gt_novelty_v (nb_frame,):
+    """
+
+    nb_frame = len(time_sec_v)
+    # --- class of each segment, classes are numbered in increasing label order
+    _, class_v = np.unique(np.asarray(label_v), return_inverse=True)
+    nb_class = int(class_v.max()) + 1 if len(class_v) else 0
+
+    # --- for segment, check A < time_sec_v <= B: (nb_seg, nb_frame)
+    inside_m = (np.asarray(start_v)[:, None] < time_sec_v[None, :]) & (
+        time_sec_v[None, :] <= np.asarray(stop_v)[:, None]
+    )
+
+    # --- state: frame is in at least one segment of the class
+    class_onehot_m = np.zeros((nb_class, len(class_v)))
+    class_onehot_m[class_v, np.arange(len(class_v))] = 1
+    label_state_m = 1.0 * (class_onehot_m.dot(inside_m) > 0)
     gt_SSM_m = 1.0 * label_state_m.T.dot(label_state_m)
-    # gt_SSM_m += 0.3*label_seq_m.T.dot(label_seq_m)
+
+    # --- class of each frame: the last segment containing it wins, 0 outside segments
+    label_state_v = np.zeros(nb_frame)
+    if len(class_v):
+        last_seg_v = len(class_v) - 1 - np.argmax(inside_m[::-1], axis=0)
+        covered_v = inside_m.any(axis=0)
+        label_state_v[covered_v] = class_v[last_seg_v[covered_v]]
 
     pos_v = np.where(np.diff(label_state_v) != 0)[0] + 1
-    boundary_v = np.zeros((len(time_sec_v)))
+    boundary_v = np.zeros(nb_frame)
     boundary_v[pos_v] = 1
     gt_novelty_v = convolve(boundary_v, np.array([0.25, 0.5, 1, 0.5, 0.25]), "same")
 
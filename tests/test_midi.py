@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pretty_midi = pytest.importorskip("pretty_midi")
+
+from midi_segmentation.utils.midi import NoteTable, chroma_from_notes, piano_roll_from_notes
+
+
+def make_midi_with_drums():
+    """A piano and a drum kit; the drums end after the piano."""
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    for k, pitch in enumerate([60, 64, 67, 72, 55]):
+        piano.notes.append(pretty_midi.Note(80 + k, pitch, 0.25 * k, 0.25 * k + 0.6))
+    drums = pretty_midi.Instrument(program=0, is_drum=True)
+    for k in range(8):
+        drums.notes.append(pretty_midi.Note(100, 36 + k % 3, 0.3 * k, 0.3 * k + 0.1))
+    midi.instruments.extend([piano, drums])
+    return midi
+
+
+def test_piano_roll_matches_pretty_midi_with_drums():
+    midi = make_midi_with_drums()
+    notes = NoteTable.from_midi(midi)
+    expected = midi.get_piano_roll(fs=100)
+
+    roll = piano_roll_from_notes(notes, fs=100)
+    assert roll.shape == expected.shape
+    np.testing.assert_allclose(roll, expected)
+
+    sparse_roll = piano_roll_from_notes(notes, fs=100, pitch_range=(21, 109), sparse=True)
+    np.testing.assert_allclose(sparse_roll.toarray(), expected[21:109])
+
+
+def test_chroma_matches_pretty_midi_with_drums():
+    midi = make_midi_with_drums()
+    notes = NoteTable.from_midi(midi)
+    expected = midi.get_chroma(fs=100)
+
+    chroma = chroma_from_notes(notes, fs=100)
+    assert chroma.shape == expected.shape
+    np.testing.assert_allclose(chroma, expected)
+    np.testing.assert_allclose(chroma_from_notes(notes, fs=100, sparse=True).toarray(), expected)
+
+
+def test_drum_flag_follows_selection():
+    notes = NoteTable.from_midi(make_midi_with_drums())
+    assert notes.is_drum.sum() == 8
+    assert not notes[:5].is_drum.any()
+    assert notes.sorted().is_drum.sum() == 8
@@ -0,0 +1,17 @@
+import pytest
+
+from midi_segmentation.utils.naming import parse_segment_name, ssm_segment_name
+
+
+@pytest.mark.parametrize("sr", [2, 2.0, 2.5, 0.25, 10])
+def test_ssm_segment_name_round_trip(sr):
+    name = ssm_segment_name("my-song", 3, sr)
+    assert parse_segment_name(name) == ("my-song", 3.0)
+
+
+def test_ssm_segment_name_integer_sr():
+    assert ssm_segment_name("song", 0, 2.0) == "song-0-sr2.mid"
+
+
+def test_time_segment_name():
+    assert parse_segment_name("song_016-024.mid") == ("song", 16.0)
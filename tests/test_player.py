@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+mido = pytest.importorskip("mido")
+np = pytest.importorskip("numpy")
+
+from midi_segmentation.utils.player import MemorySink, Player, Segment
+
+
+def make_segment(name, length=0.05):
+    messages = [
+        mido.Message("note_on", note=60, velocity=64),
+        mido.Message("note_off", note=60, velocity=0),
+    ]
+    return Segment(name, np.array([0.0, length / 2]), messages, length)
+
+
+def play_in_thread(player, first, timeout=3.0):
+    """Run player.play, return the exception it raised (if any), fail if it hangs."""
+    result = {}
+
+    def target():
+        try:
+            player.play(first)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "play() did not return"
+    return result.get("error")
+
+
+def test_plays_until_no_next_segment():
+    sink = MemorySink()
+    order = {"a": "b", "b": None}
+    player = Player(sink, make_segment, order.get, preroll=0.01)
+
+    assert play_in_thread(player, "a") is None
+    assert player.played == ["a", "b"]
+    assert len(sink.sent) == 4
+
+
+def test_failing_loader_stops_playback():
+    def load(name):
+        if name == "broken":
+            raise OSError("cannot read broken")
+        return make_segment(name)
+
+    sink = MemorySink()
+    player = Player(sink, load, lambda name: "broken", preroll=0.01)
+
+    error = play_in_thread(player, "a")
+    assert isinstance(error, OSError)
+    assert player.played == ["a"]
+
+
+def test_failing_first_segment():
+    def load(name):
+        raise OSError("cannot read")
+
+    player = Player(MemorySink(), load, lambda name: None, preroll=0.01)
+
+    assert isinstance(play_in_thread(player, "a"), OSError)
+    assert player.played == []
+
+
+def test_choose_next_not_called_after_stop():
+    calls = []
+
+    def choose_next(name):
+        calls.append(name)
+        return name
+
+    player = Player(MemorySink(), make_segment, choose_next, preroll=0.01)
+    threading.Timer(0.2, player.stop).start()
+    assert play_in_thread(player, "a") is None
+    nb_call = len(calls)
+    threading.Event().wait(0.3)
+    assert len(calls) == nb_call
@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+librosa = pytest.importorskip("librosa")
+soundfile = pytest.importorskip("soundfile")
+pytest.importorskip("torch")
+
+from ssmnet import utils
+
+STEP_TARGET_SEC = 0.1
+
+
+@pytest.fixture(params=[44100, 22050])
+def audio_file(request, tmp_path):
+    """20 s stereo sweep plus noise, at a native and at the model sample-rate"""
+    sr_hz = request.param
+    rng = np.random.default_rng(0)
+    t_v = np.arange(int(sr_hz * 20.3)) / sr_hz
+    audio_v = 0.3 * np.sin(2 * np.pi * (220 + 50 * t_v) * t_v) + 0.05 * rng.standard_normal(len(t_v))
+    audio_file = tmp_path / f"sweep_{sr_hz}.wav"
+    soundfile.write(audio_file, np.stack((audio_v, np.roll(audio_v, 100)), axis=1), sr_hz)
+    return str(audio_file)
+
+
+@pytest.mark.parametrize("block_sec", [60.0, 2.0, 0.37])
+def test_stream_matches_full_extraction(audio_file, block_sec):
+    audio_v, sr_hz = librosa.load(audio_file)
+    logmel_m, time_sec_v = utils.f_extract_feature(audio_v, sr_hz)
+    logmel_sync_m, time_sync_sec_v = utils.f_reduce_time(logmel_m, time_sec_v, STEP_TARGET_SEC)
+
+    stream_m, stream_time_sec_v = utils.f_extract_feature_stream(
+        audio_file, STEP_TARGET_SEC, block_sec
+    )
+
+    assert stream_m.shape == logmel_sync_m.shape
+    np.testing.assert_allclose(stream_time_sec_v, time_sync_sec_v, atol=1e-9)
+    # --- same frames everywhere, block edges included; only the statistics are rounded differently
+    np.testing.assert_allclose(stream_m, logmel_sync_m, atol=1e-4)